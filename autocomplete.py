@@ -0,0 +1,84 @@
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+class TrieNode:
+    __slots__ = ('children', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.top = ()  # (count, completion) pairs, highest count first
+
+class Autocomplete:
+    """Prefix trie over logged queries and vocabulary terms.
+
+    Each node keeps its top-k completions precomputed, so a keystroke lookup
+    only walks the prefix. Counts only ever grow, which lets addQuery keep
+    every top-k list exact by updating the nodes along a single path.
+    Lookups take no lock: writers replace a node's top tuple in one
+    assignment, so readers always see a complete list.
+    """
+
+    def __init__(self, k=10):
+        self.k = k
+        self.root = TrieNode()
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def normalize(self, text):
+        return " ".join(text.lower().split())
+
+    def addQuery(self, query, count=1):
+        query = self.normalize(query)
+        if not query or count <= 0:
+            return
+        with self.lock:
+            total = self.counts.get(query, 0) + count
+            self.counts[query] = total
+            node = self.root
+            self.updateTop(node, query, total)
+            for ch in query:
+                child = node.children.get(ch)
+                if child is None:
+                    child = TrieNode()
+                    node.children[ch] = child
+                node = child
+                self.updateTop(node, query, total)
+
+    def updateTop(self, node, query, total):
+        top = [entry for entry in node.top if entry[1] != query]
+        if len(top) >= self.k and total <= top[-1][0]:
+            return
+        top.append((total, query))
+        top.sort(key=lambda x: (-x[0], x[1]))
+        node.top = tuple(top[:self.k])
+
+    def addQueries(self, queryCounts: Iterable[Tuple[str, int]]):
+        for query, count in queryCounts:
+            self.addQuery(query, count)
+        return self
+
+    def addVocabulary(self, freqWordDoc: Dict[str, int], surfaceForms: Dict[str, str]):
+        """
+        Add index terms, weighted by the number of documents containing them.
+        Terms are stems, so each is added as the word it was most often written
+        as in surfaceForms; terms with no surface form are left out.
+        """
+        for stem, frequency in freqWordDoc.items():
+            word = surfaceForms.get(stem)
+            if word:
+                self.addQuery(word, frequency)
+        return self
+
+    def complete(self, prefix, limit=None) -> List[str]:
+        prefix = prefix.lower().lstrip()
+        trailingSpace = prefix[-1:].isspace()
+        prefix = self.normalize(prefix) + (" " if trailingSpace else "")
+        node = self.root
+        for ch in prefix:
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        top = node.top
+        if limit is not None:
+            top = top[:limit]
+        return [query for _, query in top]
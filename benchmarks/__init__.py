@@ -0,0 +1 @@
+"""Offline benchmarks for every pipeline stage. Run from the project root: python -m benchmarks.run"""
@@ -0,0 +1,97 @@
+import bisect
+import random
+import string
+from typing import List
+
+import getPage as GetPage
+
+class SyntheticCorpus:
+    """
+    Deterministic synthetic corpus. Words are drawn from a Zipfian distribution
+    (frequency of the word at rank r proportional to 1 / r**zipf) over a
+    generated vocabulary, so term statistics look like real text.
+    The same seed and sizes always give the same corpus.
+    """
+
+    def __init__(self, numDocs=200, docLength=100, titleLength=6, vocabSize=20000, zipf=1.1, seed=42):
+        self.numDocs = numDocs
+        self.docLength = docLength
+        self.titleLength = titleLength
+        self.vocabSize = vocabSize
+        self.zipf = zipf
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.vocab = self.makeVocabulary()
+        weights = [1 / (rank ** zipf) for rank in range(1, vocabSize + 1)]
+        self.cumWeights = []
+        total = 0
+        for w in weights:
+            total += w
+            self.cumWeights.append(total)
+
+    def makeVocabulary(self):
+        suffixes = ['', '', '', 's', 'ing', 'ed', 'ation', 'ness', 'ly', 'ies', 'ment', 'er']
+        vocab = []
+        seen = set()
+        while len(vocab) < self.vocabSize:
+            length = self.rng.randint(3, 9)
+            word = ''.join(self.rng.choice(string.ascii_lowercase) for _ in range(length))
+            word += self.rng.choice(suffixes)
+            if word not in seen:
+                seen.add(word)
+                vocab.append(word)
+        return vocab
+
+    def config(self):
+        return {'numDocs': self.numDocs, 'docLength': self.docLength, 'titleLength': self.titleLength,
+                'vocabSize': self.vocabSize, 'zipf': self.zipf, 'seed': self.seed}
+
+    def words(self, n, rng=None) -> List[str]:
+        rng = rng or self.rng
+        total = self.cumWeights[-1]
+        return [self.vocab[bisect.bisect_left(self.cumWeights, rng.random() * total)] for _ in range(n)]
+
+    def title(self, rng=None):
+        return ' '.join(self.words(self.titleLength, rng)).title()
+
+    def body(self, rng=None):
+        words = self.words(self.docLength, rng)
+        # Sentence breaks every ~12 words so the text has punctuation to clean
+        return ' '.join(w + '.' if i % 12 == 11 else w for i, w in enumerate(words))
+
+    def pages(self) -> List[GetPage.Page]:
+        rng = random.Random(self.seed + 1)
+        pages = []
+        for pageId in range(self.numDocs):
+            pages.append(GetPage.Page(pageId, None, self.url(pageId), self.title(rng),
+                                      'Mon, 01 Jan 2024 00:00:00 GMT', self.body(rng)))
+        return pages
+
+    def url(self, pageId):
+        return f"http://bench.local/page{pageId}.html"
+
+    def html(self, pageId, links=10, rng=None) -> str:
+        """A crawlable page: title, headings, paragraphs and links to other synthetic pages."""
+        rng = rng or random.Random(self.seed + 2 + pageId)
+        paragraphs = []
+        for _ in range(max(1, self.docLength // 40)):
+            paragraphs.append(f"<p>{' '.join(self.words(40, rng))}</p>")
+        anchors = []
+        for _ in range(links):
+            target = rng.randrange(self.numDocs)
+            anchors.append(f'<li><a href="/page{target}.html">{" ".join(self.words(3, rng))}</a></li>')
+        anchors.append('<li><a href="http://elsewhere.local/">external</a></li>')
+        return (f"<html><head><title>{self.title(rng)}</title></head><body>"
+                f"<h1>{self.title(rng)}</h1>{''.join(paragraphs)}<ul>{''.join(anchors)}</ul>"
+                f"</body></html>")
+
+    def queries(self, n, maxTerms=3, phraseRate=0.1) -> List[str]:
+        rng = random.Random(self.seed + 3)
+        queries = []
+        for _ in range(n):
+            terms = self.words(rng.randint(1, maxTerms), rng)
+            query = ' '.join(terms)
+            if len(terms) > 1 and rng.random() < phraseRate:
+                query = f'"{query}"'
+            queries.append(query)
+        return queries
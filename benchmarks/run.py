@@ -0,0 +1,207 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+import database as Database
+import getPage as GetPage
+import indexer as Indexer
+import searchEngine as SearchEngine
+import storedFields as StoredFields
+
+from benchmarks.corpus import SyntheticCorpus
+from benchmarks.stats import latency_summary
+
+# Every metric under "metrics" is a time, so lower is better; "info" is never compared
+STAGES = ['porter', 'extract', 'analyze', 'index', 'database', 'search']
+
+def best_of(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def bench_porter(corpus, state, args):
+    words = corpus.words(args.porter_words, random.Random(corpus.seed + 10))
+    porter = Indexer.Porter()
+    elapsed = best_of(lambda: [porter.strip_affixes(w) for w in words], args.repeat)
+    return {'metrics': {'per_word_us': elapsed / len(words) * 1e6, 'total_s': elapsed},
+            'info': {'words': len(words)}}
+
+def bench_extract(corpus, state, args):
+    numPages = min(args.html_pages, corpus.numDocs)
+    pages = [corpus.html(pageId) for pageId in range(numPages)]
+    spider = GetPage.Spider(corpus.url(0), 0)
+    metrics = {}
+    for name, fn in [('title', lambda h: spider.extract_title(h)),
+                     ('text', lambda h: spider.extract_text(h)),
+                     ('links', lambda h: spider.extract_links(h, corpus.url(0)))]:
+        elapsed = best_of(lambda: [fn(h) for h in pages], args.repeat)
+        metrics[f'{name}_per_page_ms'] = elapsed / numPages * 1000
+    return {'metrics': metrics, 'info': {'pages': numPages, 'avg_html_bytes': sum(map(len, pages)) // numPages}}
+
+def bench_analyze(corpus, state, args):
+    pages = state.setdefault('pages', corpus.pages())
+    start = time.perf_counter()
+    files = [Indexer.File(page) for page in pages]
+    elapsed = time.perf_counter() - start
+    state['files'] = files
+    return {'metrics': {'per_doc_ms': elapsed / len(files) * 1000, 'total_s': elapsed},
+            'info': {'docs': len(files)}}
+
+def analyzed(corpus, state):
+    if 'files' not in state:
+        state['files'] = [Indexer.File(page) for page in state.setdefault('pages', corpus.pages())]
+    return state['files']
+
+def bench_index(corpus, state, args):
+    files = analyzed(corpus, state)
+    indexer = Indexer.Indexer()
+    start = time.perf_counter()
+    for file in files:
+        indexer.indexDoc(file.file_id, file.title, file.body)
+    elapsed = time.perf_counter() - start
+    state['indexer'] = indexer
+    return {'metrics': {'per_doc_ms': elapsed / len(files) * 1000, 'total_s': elapsed},
+            'info': {'docs': indexer.docNo, 'terms': len(indexer.invInd),
+                     'postings': sum(len(p) for p in indexer.invInd.values())}}
+
+def built_index(corpus, state, args):
+    if 'indexer' not in state:
+        bench_index(corpus, state, args)
+    return state['indexer']
+
+def bench_database(corpus, state, args):
+    indexer = built_index(corpus, state, args)
+    pages = state['pages']
+    metrics = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        db = Database.Database(path)
+        for name, fn in [('save_pages_s', lambda: db.save_pages(pages)),
+                         ('save_indexer_data_s', lambda: db.save_indexer_data(indexer.lenDoc, indexer.maxTf, indexer.docNo, indexer.freqWordDoc)),
+                         ('save_inverted_index_s', lambda: db.save_inverted_index(indexer.invInd)),
+                         ('load_indexer_data_s', db.load_indexer_data),
+                         ('load_inverted_index_s', db.load_inverted_index)]:
+            # Saves use INSERT OR REPLACE, so repeating them is safe
+            metrics[name] = best_of(fn, args.repeat)
+        # Every title through a cold block cache, as a result page would fetch them
+        elapsed = best_of(lambda: [StoredFields.StoredFields(db).title(page.page_id) for page in pages], args.repeat)
+        metrics['stored_title_per_doc_us'] = elapsed / len(pages) * 1e6
+        db.close()
+        size = os.path.getsize(path)
+    return {'metrics': metrics, 'info': {'db_bytes': size}}
+
+def bench_search(corpus, state, args):
+    indexer = built_index(corpus, state, args)
+    engine = SearchEngine.SearchEngine(indexer, storedFields=StoredFields.StoredFields().addPages(state['pages']))
+    queries = corpus.queries(args.queries)
+    latencies = []
+    results = 0
+    for query in queries:
+        start = time.perf_counter()
+        results += len(engine.search(query))
+        latencies.append(time.perf_counter() - start)
+    rng = random.Random(corpus.seed + 20)
+    docIds = [rng.randrange(corpus.numDocs) for _ in range(args.similar)]
+    similarLatencies = []
+    for docId in docIds:
+        start = time.perf_counter()
+        engine.similarSearch(docId)
+        similarLatencies.append(time.perf_counter() - start)
+    metrics = {f'search_{k}': v for k, v in latency_summary(latencies).items()}
+    metrics.update({f'similar_{k}': v for k, v in latency_summary(similarLatencies).items()})
+    return {'metrics': metrics, 'info': {'queries': len(queries), 'avg_results': results / max(1, len(queries)),
+                                         'similar_docs': len(docIds)}}
+
+BENCHMARKS = {
+    'porter': bench_porter,
+    'extract': bench_extract,
+    'analyze': bench_analyze,
+    'index': bench_index,
+    'database': bench_database,
+    'search': bench_search,
+}
+
+def run(args):
+    corpus = SyntheticCorpus(args.docs, args.doc_length, vocabSize=args.vocab, zipf=args.zipf, seed=args.seed)
+    stages = args.only.split(',') if args.only else STAGES
+    state = {}
+    report = {
+        'meta': {'corpus': corpus.config(), 'python': platform.python_version(),
+                 'platform': platform.platform(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')},
+        'benchmarks': {},
+    }
+    for stage in stages:
+        print(f"Running {stage}...", file=sys.stderr)
+        report['benchmarks'][stage] = BENCHMARKS[stage](corpus, state, args)
+    return report
+
+def compare(baseline, current, threshold, minDelta):
+    """
+    Compare two reports metric by metric.
+    A metric regresses when it is more than threshold (a fraction) slower and
+    the absolute difference is above minDelta, which hides noise on tiny values.
+    Returns list of (stage, metric, baseline, current, change) for every shared metric, and list of regressions
+    """
+    rows = []
+    regressions = []
+    for stage, result in current['benchmarks'].items():
+        baseMetrics = baseline['benchmarks'].get(stage, {}).get('metrics', {})
+        for metric, value in result['metrics'].items():
+            if metric not in baseMetrics:
+                continue
+            base = baseMetrics[metric]
+            change = (value - base) / base if base else 0.0
+            row = (stage, metric, base, value, change)
+            rows.append(row)
+            if change > threshold and value - base > minDelta:
+                regressions.append(row)
+    return rows, regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Offline benchmarks over a synthetic corpus')
+    parser.add_argument('--docs', type=int, default=200)
+    parser.add_argument('--doc-length', type=int, default=100)
+    parser.add_argument('--vocab', type=int, default=20000)
+    parser.add_argument('--zipf', type=float, default=1.1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--similar', type=int, default=5, help='Documents to run similarSearch for')
+    parser.add_argument('--porter-words', type=int, default=20000)
+    parser.add_argument('--html-pages', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3, help='Repetitions of stateless benchmarks, best is kept')
+    parser.add_argument('--only', help=f'Comma separated stages out of {",".join(STAGES)}')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help='Compare two JSON reports instead of running')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Slowdown fraction flagged as a regression')
+    parser.add_argument('--min-delta', type=float, default=1e-3, help='Ignore absolute differences below this, in each metric\'s own unit')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        if baseline['meta']['corpus'] != current['meta']['corpus']:
+            print("Warning: reports were run on different corpora", file=sys.stderr)
+        rows, regressions = compare(baseline, current, args.threshold, args.min_delta)
+        for stage, metric, base, value, change in rows:
+            flag = '  REGRESSION' if (stage, metric, base, value, change) in regressions else ''
+            print(f"{stage:10} {metric:28} {base:12.4f} -> {value:12.4f} ({change:+.1%}){flag}")
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+        sys.exit(1 if regressions else 0)
+
+    report = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,22 @@
+import math
+from typing import Dict, List
+
+def percentile(sortedValues: List[float], p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sortedValues:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sortedValues)))
+    return sortedValues[min(rank, len(sortedValues)) - 1]
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/max/mean of a list of latencies, in milliseconds."""
+    values = sorted(latencies)
+    if not values:
+        return {'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0, 'mean_ms': 0.0}
+    return {
+        'p50_ms': percentile(values, 50) * 1000,
+        'p95_ms': percentile(values, 95) * 1000,
+        'p99_ms': percentile(values, 99) * 1000,
+        'max_ms': values[-1] * 1000,
+        'mean_ms': sum(values) / len(values) * 1000,
+    }
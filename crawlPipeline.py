@@ -0,0 +1,175 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import getPage as GetPage
+import indexer as Indexer
+import instrumentation as Instrumentation
+import simhash as SimHash
+
+STATS = Instrumentation.STATS
+log = logging.getLogger(__name__)
+
+class ParsedPage:
+    """What a parser process sends back: small compared to the raw HTML."""
+    __slots__ = ('url', 'last_modified', 'title', 'body', 'analyzed', 'links', 'simhash', 'timings')
+
+    def __init__(self, url, last_modified, title, body, analyzed, links, simhash, timings=None):
+        self.url = url
+        self.last_modified = last_modified
+        self.title = title
+        self.body = body
+        self.analyzed = analyzed
+        self.links = links
+        self.simhash = simhash
+        self.timings = timings or {}  # stage -> seconds spent in the parser process
+
+parserSpider = None
+
+def init_parser(start_url):
+    global parserSpider
+    # Only used for its extract_* methods and same-domain check; never crawls
+    parserSpider = GetPage.Spider(start_url, 0, duplicate_distance=None)
+
+def parse_page(url, html, last_modified, base_url, fingerprintBits):
+    """
+    Runs in a parser process: HTML extraction, link extraction (relative to
+    base_url), stop/stem analysis and a fingerprintBits-wide SimHash (if not None).
+    Stage times are returned with the page, as this process's STATS never reach the crawler's.
+    """
+    start = time.perf_counter()
+    title = parserSpider.extract_title(html)
+    body = parserSpider.extract_text(html)
+    links, link_texts = parserSpider.extract_links(html, base_url)
+    parsed = time.perf_counter()
+    file = Indexer.File(GetPage.Page(None, None, url, title or '', last_modified, body))
+    analyzed = time.perf_counter()
+    fingerprint = SimHash.simhash(body, bits=fingerprintBits) if fingerprintBits else None
+    timings = {'parse': parsed - start, 'analyze': analyzed - parsed}
+    if fingerprint is not None:
+        timings['simhash'] = time.perf_counter() - analyzed
+    return ParsedPage(url, last_modified, title, body, (file.title, file.body, file.surfaces), sorted(links),
+                      fingerprint, timings)
+
+def fetcher(spider, urls, raw):
+    while True:
+        url = urls.get()
+        if url is None:
+            break
+        try:
+            html, last_modified, base_url = spider.fetch_page(url)
+        except Exception:
+            # Anything fetch_page does not handle itself; the url still has to be reported back
+            log.exception("Fetching %s failed", url)
+            STATS.count('fetch_errors')
+            html, last_modified, base_url = None, None, None
+        # Blocks while the parsers are behind, which stops this fetcher too
+        raw.put((url, html, last_modified, base_url))
+
+def crawl(spider: GetPage.Spider, fetchers=8, parsers=None, queue_size=64):
+    for _ in crawl_iter(spider, fetchers, parsers, queue_size):
+        if spider.unsaved >= spider.checkpoint_every:
+            spider.checkpoint()
+    spider.checkpoint()
+    spider.report()
+
+def crawl_iter(spider: GetPage.Spider, fetchers=8, parsers=None, queue_size=64):
+    """
+    Crawl with fetching and parsing on separate resources. fetchers threads
+    download pages into a bounded queue of raw HTML; a pool of parsers
+    processes extracts, analyzes and fingerprints them and returns compact
+    ParsedPage results. This thread owns all Spider state: it assigns page IDs,
+    feeds new links to the frontier and yields the list of pages each parsed
+    page added, between which callers may checkpoint. At most queue_size raw
+    pages and 2 * parsers parse jobs exist at any time, so memory stays bounded.
+    Unlike Spider.crawl, every page is fetched once, when it leaves the
+    frontier, and keeps its own <title>; its parent is the first page that
+    linked to it.
+    """
+    parsers = parsers or os.cpu_count() or 1
+    urls = queue.Queue()
+    raw = queue.Queue(maxsize=queue_size)
+    threads = [threading.Thread(target=fetcher, args=(spider, urls, raw), daemon=True) for _ in range(fetchers)]
+    for thread in threads:
+        thread.start()
+    firstParent = {}
+    inFlight = set()  # urls handed to fetchers or parsers
+    parsing = {}  # parse job -> url
+    fingerprintBits = spider.duplicates.bits if spider.duplicates is not None else None
+    with ProcessPoolExecutor(max_workers=parsers, initializer=init_parser, initargs=(spider.start_url,)) as pool:
+        while True:
+            # Keep fetchers busy without fetching more pages than the crawl may still visit
+            while (len(inFlight) < fetchers * 2 and len(spider.visited) + len(inFlight) < spider.num_pages
+                   and spider.queue):
+                url = spider.queue.popleft()
+                if url in spider.visited or url in inFlight:
+                    spider.finish_url(url)
+                    continue
+                inFlight.add(url)
+                urls.put(url)
+            if not inFlight:
+                break
+            # Hand fetched pages to the parsers, waiting for a fetch only if nothing is parsing
+            while len(parsing) < parsers * 2:
+                try:
+                    url, html, last_modified, base_url = raw.get_nowait() if parsing else raw.get(timeout=1.0)
+                except queue.Empty:
+                    if not parsing and not any(thread.is_alive() for thread in threads):
+                        raise RuntimeError(f"all fetcher threads died with {len(inFlight)} pages in flight")
+                    break
+                if html is None:
+                    inFlight.discard(url)
+                    spider.finish_url(url)
+                    continue
+                parsing[pool.submit(parse_page, url, html, last_modified, base_url, fingerprintBits)] = url
+            if not parsing:
+                continue
+            done, _ = wait(parsing, timeout=0.05, return_when=FIRST_COMPLETED)
+            for future in done:
+                url = parsing.pop(future)
+                inFlight.discard(url)
+                try:
+                    parsed = future.result()
+                except Exception:
+                    # Lose this page only, like a failed fetch
+                    log.exception("Parsing %s failed", url)
+                    STATS.count('parse_errors')
+                    spider.finish_url(url)
+                    continue
+                added = add_parsed(spider, parsed, firstParent)
+                spider.finish_url(url)
+                yield added
+    for _ in threads:
+        urls.put(None)
+    spider.finished = True
+
+def add_parsed(spider, parsed, firstParent):
+    """Record a parsed page and queue its links. Returns the list of pages added."""
+    spider.visited.add(parsed.url)
+    STATS.count('pages_parsed')
+    for stage, seconds in parsed.timings.items():
+        STATS.recordTime(stage, seconds)
+    added = []
+    if parsed.url in spider.page_index:
+        page_id = spider.page_index[parsed.url]['id']
+    else:
+        page = spider.add_page(parsed.url, parsed.title, parsed.body, parsed.last_modified, parsed.simhash)
+        page.analyzed = parsed.analyzed
+        page_id = page.page_id
+        added.append(page)
+        parent_id = firstParent.pop(parsed.url, None)
+        if parent_id is not None:
+            spider.add_relation(parent_id, page_id)
+    for link in parsed.links:
+        if link in spider.visited:
+            continue
+        if link in spider.page_index:
+            spider.add_relation(page_id, spider.page_index[link]['id'])
+            continue
+        if link not in firstParent:
+            firstParent[link] = page_id
+            spider.queue.append(link)
+    return added
@@ -1,10 +1,20 @@
 import sqlite3
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import ast
+import uuid
+from collections import Counter
+
+import fuzzyIndex as FuzzyIndex
+import getPage as GetPage
+import simhash as SimHash
+import storedFields as StoredFields
+import instrumentation as Instrumentation
+
+STATS = Instrumentation.STATS
 
 class Database:
-    def __init__(self, db_name="search_engine.db"):
-        self.conn = sqlite3.connect(db_name)
+    def __init__(self, db_name="search_engine.db", check_same_thread=True):
+        self.conn = sqlite3.connect(db_name, check_same_thread=check_same_thread)
         self.create_tables()
 
     def create_tables(self):
@@ -17,9 +27,16 @@ class Database:
             url TEXT NOT NULL,
             title TEXT,
             last_modified TEXT,
-            body TEXT
+            body TEXT,
+            simhash INTEGER,
+            duplicate_of INTEGER
         )
         ''')
+        # Add the near-duplicate columns to pages tables created before they existed
+        columns = {row[1] for row in cursor.execute('PRAGMA table_info(pages)')}
+        for column in ('simhash', 'duplicate_of'):
+            if column not in columns:
+                cursor.execute(f'ALTER TABLE pages ADD COLUMN {column} INTEGER')
 
         # Create inverted_index table
         cursor.execute('''
@@ -40,19 +57,20 @@ class Database:
             doc_id INTEGER NOT NULL,
             score REAL NOT NULL,
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            search_id TEXT,
             FOREIGN KEY (doc_id) REFERENCES pages (page_id)
         )
         ''')
+        # Add the search id column to search_results tables created before it existed
+        columns = {row[1] for row in cursor.execute('PRAGMA table_info(search_results)')}
+        if 'search_id' not in columns:
+            cursor.execute('ALTER TABLE search_results ADD COLUMN search_id TEXT')
 
-        # Create docs table to store document information
+        # Create stored_fields table (zlib-compressed url, title and body, BLOCK_SIZE pages per row)
         cursor.execute('''
-        CREATE TABLE IF NOT EXISTS docs (
-            doc_id INTEGER PRIMARY KEY,
-            title TEXT,
-            content TEXT,
-            title_words TEXT,
-            content_words TEXT,
-            FOREIGN KEY (doc_id) REFERENCES pages (page_id)
+        CREATE TABLE IF NOT EXISTS stored_fields (
+            block_id INTEGER PRIMARY KEY,
+            data BLOB NOT NULL
         )
         ''')
 
@@ -61,9 +79,14 @@ class Database:
         CREATE TABLE IF NOT EXISTS document_lengths (
             doc_id INTEGER PRIMARY KEY,
             length INTEGER NOT NULL,
+            max_tf INTEGER,
             FOREIGN KEY (doc_id) REFERENCES pages (page_id)
         )
         ''')
+        # Add the max term frequency column to document_lengths tables created before it existed
+        columns = {row[1] for row in cursor.execute('PRAGMA table_info(document_lengths)')}
+        if 'max_tf' not in columns:
+            cursor.execute('ALTER TABLE document_lengths ADD COLUMN max_tf INTEGER')
 
         # Create word_frequencies table
         cursor.execute('''
@@ -73,6 +96,16 @@ class Database:
         )
         ''')
 
+        # Create surface_forms table (how often each word was stemmed to stem)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS surface_forms (
+            stem TEXT NOT NULL,
+            word TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (stem, word)
+        )
+        ''')
+
         # Create document_count table
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS document_count (
@@ -80,17 +113,208 @@ class Database:
         )
         ''')
 
+        # Create pages url index, used to resume crawls
+        cursor.execute('CREATE INDEX IF NOT EXISTS pages_url ON pages (url)')
+
+        # Create frontier table (persistent crawl queue)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS frontier (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT NOT NULL UNIQUE,
+            done INTEGER NOT NULL DEFAULT 0
+        )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS frontier_pending ON frontier (done, seq)')
+
+        # Create crawl_state table (checkpointed Spider counters and seen-set)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_state (
+            key TEXT PRIMARY KEY,
+            value
+        )
+        ''')
+
+        # Create fuzzy_deletes table (deletion dictionary for typo-tolerant search)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fuzzy_deletes (
+            deletion TEXT NOT NULL,
+            word TEXT NOT NULL,
+            PRIMARY KEY (deletion, word)
+        )
+        ''')
+
+        # Create fuzzy_settings table
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fuzzy_settings (
+            max_edit INTEGER NOT NULL,
+            prefix_len INTEGER NOT NULL
+        )
+        ''')
+
+        self.conn.commit()
+
+    def drop_legacy_tables(self):
+        """
+        Drop the docs table of databases built before stored_fields and compact
+        the file. Only for rebuilding such a database: the table's text is lost.
+        Returns whether there was a docs table.
+        """
+        cursor = self.conn.cursor()
+        if cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'docs'").fetchone() is None:
+            return False
+        cursor.execute('DROP TABLE docs')
         self.conn.commit()
+        cursor.execute('VACUUM')
+        return True
 
+    def check_index_format(self, maxTf: Dict[int, int]):
+        """
+        Raise if the index was built before max term frequencies and
+        stored_fields existed; such an index cannot be searched.
+        """
+        cursor = self.conn.cursor()
+        if maxTf and (None in maxTf.values() or cursor.execute('SELECT 1 FROM stored_fields LIMIT 1').fetchone() is None):
+            raise RuntimeError("the index in this database was built by an older version; "
+                               "rebuild it with python main.py --fresh-crawl")
+
+    @STATS.timed('db_write')
     def save_pages(self, pages: List[Any]):
         cursor = self.conn.cursor()
+        # Title and body are only kept in stored_fields
         for page in pages:
             cursor.execute('''
-            INSERT OR REPLACE INTO pages (page_id, url, title, last_modified, body)
-            VALUES (?, ?, ?, ?, ?)
-            ''', (page.page_id, page.url, page.title, page.last_modified, page.body))
+            INSERT OR REPLACE INTO pages (page_id, url, title, last_modified, body, simhash, duplicate_of)
+            VALUES (?, ?, NULL, ?, NULL, ?, ?)
+            ''', (page.page_id, page.url, page.last_modified,
+                  SimHash.to_signed(page.simhash), page.duplicate_of))
+        self.save_stored_fields(pages)
+        self.conn.commit()
+
+    def save_stored_fields(self, pages: List[Any]):
+        """
+        Add the url, title and body of pages to their compressed blocks.
+        Blocks that already hold other pages are rewritten. Not committed.
+        """
+        blocks = {}
+        for page in pages:
+            blocks.setdefault(StoredFields.block_of(page.page_id), {})[page.page_id] = (page.url, page.title, page.body)
+        cursor = self.conn.cursor()
+        for block_id, fields in blocks.items():
+            cursor.execute('SELECT data FROM stored_fields WHERE block_id = ?', (block_id,))
+            row = cursor.fetchone()
+            if row is not None:
+                fields = {**StoredFields.decode_block(row[0]), **fields}
+            cursor.execute('''
+            INSERT OR REPLACE INTO stored_fields (block_id, data)
+            VALUES (?, ?)
+            ''', (block_id, StoredFields.encode_block(fields)))
+
+    @STATS.timed('db_read')
+    def load_stored_block(self, block_id: int) -> Optional[bytes]:
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT data FROM stored_fields WHERE block_id = ?', (block_id,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    @STATS.timed('db_read')
+    def load_pages(self) -> List[GetPage.Page]:
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT data FROM stored_fields')
+        fields = {}
+        for (data,) in cursor.fetchall():
+            fields.update(StoredFields.decode_block(data))
+        cursor.execute('SELECT page_id, url, last_modified, simhash, duplicate_of FROM pages ORDER BY page_id')
+        pages = []
+        for page_id, url, last_modified, simhash, duplicate_of in cursor.fetchall():
+            _, title, body = fields.get(page_id, (url, None, None))
+            pages.append(GetPage.Page(page_id, None, url, title, last_modified, body,
+                                      SimHash.from_signed(simhash), duplicate_of))
+        return pages
+
+    @STATS.timed('db_read')
+    def load_simhashes(self) -> List[tuple]:
+        """
+        Load the near-duplicate fingerprints of crawled pages.
+        Returns list of tuples containing (page_id, simhash, duplicate_of)
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT page_id, simhash, duplicate_of FROM pages WHERE simhash IS NOT NULL ORDER BY page_id')
+        return [(page_id, SimHash.from_signed(simhash), duplicate_of) for page_id, simhash, duplicate_of in cursor.fetchall()]
+
+    def lookup_page(self, url: str) -> Optional[tuple]:
+        """
+        Find a crawled page by url.
+        Returns (page_id, last_modified), or None if the url was never crawled
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT page_id, last_modified FROM pages WHERE url = ? LIMIT 1', (url,))
+        return cursor.fetchone()
+
+    def frontier_push(self, url: str):
+        """Queue url unless it was ever queued before. Not committed until save_checkpoint."""
+        self.conn.execute('INSERT OR IGNORE INTO frontier (url) VALUES (?)', (url,))
+
+    def frontier_pop(self, after_seq: int = 0) -> Optional[tuple]:
+        """
+        Find the oldest pending url queued after after_seq. It stays pending
+        until frontier_done, so a crawl resumed from a checkpoint retries urls
+        that were taken but not finished.
+        Returns (seq, url), or None if there is none
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT seq, url FROM frontier WHERE done = 0 AND seq > ? ORDER BY seq LIMIT 1', (after_seq,))
+        return cursor.fetchone()
+
+    def frontier_done(self, url: str):
+        """Mark url as finished. Not committed until save_checkpoint."""
+        self.conn.execute('UPDATE frontier SET done = 1 WHERE url = ?', (url,))
+
+    def frontier_size(self, after_seq: int = 0) -> int:
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM frontier WHERE done = 0 AND seq > ?', (after_seq,))
+        return cursor.fetchone()[0]
+
+    @STATS.timed('db_write')
+    def save_checkpoint(self, pages: List[Any], state: Dict[str, Any]):
+        """
+        Save new pages and the crawl state, and commit them together with all
+        frontier changes since the last checkpoint in one transaction.
+        """
+        cursor = self.conn.cursor()
+        cursor.executemany('''
+        INSERT OR REPLACE INTO pages (page_id, url, title, last_modified, body, simhash, duplicate_of)
+        VALUES (?, ?, NULL, ?, NULL, ?, ?)
+        ''', ((page.page_id, page.url, page.last_modified,
+               SimHash.to_signed(page.simhash), page.duplicate_of) for page in pages))
+        self.save_stored_fields(pages)
+        cursor.executemany('''
+        INSERT OR REPLACE INTO crawl_state (key, value)
+        VALUES (?, ?)
+        ''', state.items())
         self.conn.commit()
 
+    def load_crawl_state(self) -> Dict[str, Any]:
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT key, value FROM crawl_state')
+        return dict(cursor.fetchall())
+
+    def clear_crawl_state(self):
+        """Forget the crawl: its checkpoint, frontier and pages."""
+        cursor = self.conn.cursor()
+        cursor.execute('DELETE FROM frontier')
+        cursor.execute('DELETE FROM crawl_state')
+        cursor.execute('DELETE FROM pages')
+        cursor.execute('DELETE FROM stored_fields')
+        self.conn.commit()
+
+    def clear_index(self):
+        cursor = self.conn.cursor()
+        for table in ('inverted_index', 'document_lengths', 'word_frequencies', 'surface_forms',
+                      'document_count', 'fuzzy_deletes', 'fuzzy_settings'):
+            cursor.execute(f'DELETE FROM {table}')
+        self.conn.commit()
+
+    @STATS.timed('db_write')
     def save_inverted_index(self, inverted_index: Dict[str, Dict[int, Dict[str, List[int]]]]):
         cursor = self.conn.cursor()
         for word, docs in inverted_index.items():
@@ -103,12 +327,30 @@ class Database:
                       str(positions.get('contentPos', []))))
         self.conn.commit()
 
-    def load_inverted_index(self) -> Dict[str, Dict[int, Dict[str, List[int]]]]:
+    @STATS.timed('db_read')
+    def load_inverted_index(self, shard: int = None, num_shards: int = 1, words: List[str] = None) -> Dict[str, Dict[int, Dict[str, List[int]]]]:
+        """
+        Load the inverted index. If shard is provided, only load postings of
+        documents with doc_id % num_shards == shard. If words is provided,
+        only load the postings of those words.
+        """
         cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM inverted_index')
+        if words is not None:
+            words = list(words)
+            rows = []
+            for i in range(0, len(words), 500):
+                chunk = words[i:i + 500]
+                cursor.execute(f'SELECT * FROM inverted_index WHERE word IN ({",".join("?" * len(chunk))})', chunk)
+                rows.extend(cursor.fetchall())
+        elif shard is None:
+            cursor.execute('SELECT * FROM inverted_index')
+            rows = cursor.fetchall()
+        else:
+            cursor.execute('SELECT * FROM inverted_index WHERE doc_id % ? = ?', (num_shards, shard))
+            rows = cursor.fetchall()
         
         invInd = {}
-        for row in cursor.fetchall():
+        for row in rows:
             word, doc_id, title_positions, content_positions = row
             if word not in invInd:
                 invInd[word] = {}
@@ -119,15 +361,35 @@ class Database:
         
         return invInd
 
+    @STATS.timed('db_write')
     def save_search_results(self, query: str, results: List[tuple]):
         cursor = self.conn.cursor()
+        search_id = uuid.uuid4().hex
         for doc_id, score in results:
             cursor.execute('''
-            INSERT INTO search_results (query, doc_id, score)
-            VALUES (?, ?, ?)
-            ''', (query, doc_id, score))
+            INSERT INTO search_results (query, doc_id, score, search_id)
+            VALUES (?, ?, ?, ?)
+            ''', (query, doc_id, score, search_id))
+        self.conn.commit()
+
+    @STATS.timed('db_write')
+    def save_search_results_batch(self, rows: List[tuple]) -> int:
+        """
+        Insert many search results in a single transaction.
+        rows are tuples of (query, doc_id, score, timestamp, search_id)
+        Returns the number of rows written
+        """
+        if not rows:
+            return 0
+        cursor = self.conn.cursor()
+        cursor.executemany('''
+        INSERT INTO search_results (query, doc_id, score, timestamp, search_id)
+        VALUES (?, ?, ?, ?, ?)
+        ''', rows)
         self.conn.commit()
+        return len(rows)
 
+    @STATS.timed('db_read')
     def load_search_results(self, query: str = None) -> List[tuple]:
         """
         Load search results from database. If query is provided, load results for that specific query.
@@ -152,26 +414,47 @@ class Database:
             
         return cursor.fetchall()
 
-    def save_indexer_data(self, docs: Dict[int, Dict[str, Any]], lenDoc: Dict[int, int], docNo: int, freqWordDoc: Dict[str, int]):
+    @STATS.timed('db_read')
+    def load_query_counts(self) -> List[tuple]:
+        """
+        Count how many times each query has been logged. A logged search is the
+        group of result rows sharing a search_id (or, for rows logged before
+        search ids, a timestamp).
+        Returns list of tuples containing (query, count)
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''
+        SELECT query, COUNT(DISTINCT COALESCE(search_id, timestamp))
+        FROM search_results
+        GROUP BY query
+        ''')
+        return cursor.fetchall()
+
+    @STATS.timed('db_read')
+    def load_searches(self) -> List[str]:
+        """
+        The query of every logged search, in the order the searches were made.
+        A search is grouped as in load_query_counts.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''
+        SELECT query
+        FROM search_results
+        GROUP BY query, COALESCE(search_id, timestamp)
+        ORDER BY MIN(rowid)
+        ''')
+        return [row[0] for row in cursor.fetchall()]
+
+    @STATS.timed('db_write')
+    def save_indexer_data(self, lenDoc: Dict[int, float], maxTf: Dict[int, int], docNo: int, freqWordDoc: Dict[str, int]):
         cursor = self.conn.cursor()
         
-        # Save docs
-        for doc_id, doc_data in docs.items():
-            cursor.execute('''
-            INSERT OR REPLACE INTO docs (doc_id, title, content, title_words, content_words)
-            VALUES (?, ?, ?, ?, ?)
-            ''', (doc_id, 
-                  doc_data['title'],
-                  doc_data['content'],
-                  str(doc_data['titleWd']),
-                  str(doc_data['contentWd'])))
-        
-        # Save document lengths
+        # Save document lengths and max term frequencies
         for doc_id, length in lenDoc.items():
             cursor.execute('''
-            INSERT OR REPLACE INTO document_lengths (doc_id, length)
-            VALUES (?, ?)
-            ''', (doc_id, length))
+            INSERT OR REPLACE INTO document_lengths (doc_id, length, max_tf)
+            VALUES (?, ?, ?)
+            ''', (doc_id, length, maxTf[doc_id]))
         
         # Save word frequencies
         for word, frequency in freqWordDoc.items():
@@ -180,32 +463,97 @@ class Database:
             VALUES (?, ?)
             ''', (word, frequency))
         
-        # Save document count
+        # Save document count (the table holds a single row)
+        cursor.execute('DELETE FROM document_count')
         cursor.execute('''
-        INSERT OR REPLACE INTO document_count (count)
+        INSERT INTO document_count (count)
         VALUES (?)
         ''', (docNo,))
         
         self.conn.commit()
 
-    def load_indexer_data(self) -> tuple[Dict[int, Dict[str, Any]], Dict[int, int], int, Dict[str, int]]:
+    @STATS.timed('db_write')
+    def append_indexer_batch(self, lenDoc: Dict[int, float], maxTf: Dict[int, int],
+                             invInd: Dict[str, Dict[int, Dict[str, List[int]]]], docNo: int, commit: bool = True):
+        """
+        Add newly indexed documents to an index already in the database.
+        invInd must only hold postings of the new documents; each word's
+        frequency grows by its number of new postings.
+        """
         cursor = self.conn.cursor()
+        cursor.executemany('''
+        INSERT OR REPLACE INTO document_lengths (doc_id, length, max_tf)
+        VALUES (?, ?, ?)
+        ''', ((doc_id, length, maxTf[doc_id]) for doc_id, length in lenDoc.items()))
+        cursor.executemany('''
+        INSERT OR REPLACE INTO inverted_index (word, doc_id, title_positions, content_positions)
+        VALUES (?, ?, ?, ?)
+        ''', ((word, doc_id, str(p.get('titlePos', [])), str(p.get('contentPos', [])))
+              for word, postings in invInd.items() for doc_id, p in postings.items()))
+        cursor.executemany('''
+        INSERT INTO word_frequencies (word, frequency)
+        VALUES (?, ?)
+        ON CONFLICT (word) DO UPDATE SET frequency = frequency + excluded.frequency
+        ''', ((word, len(postings)) for word, postings in invInd.items()))
+        cursor.execute('DELETE FROM document_count')
+        cursor.execute('INSERT INTO document_count (count) VALUES (?)', (docNo,))
+        if commit:
+            self.conn.commit()
+
+    @STATS.timed('db_write')
+    def save_surface_forms(self, surfaces: Dict[tuple, int], commit: bool = True):
+        """Add (stem, word) -> count to the counts already saved."""
+        cursor = self.conn.cursor()
+        cursor.executemany('''
+        INSERT INTO surface_forms (stem, word, count)
+        VALUES (?, ?, ?)
+        ON CONFLICT (stem, word) DO UPDATE SET count = count + excluded.count
+        ''', ((stem, word, count) for (stem, word), count in surfaces.items()))
+        if commit:
+            self.conn.commit()
+
+    @STATS.timed('db_read')
+    def load_surface_forms(self) -> Counter:
+        """Returns a Counter of (stem, word) -> count"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT stem, word, count FROM surface_forms')
+        return Counter({(stem, word): count for stem, word, count in cursor.fetchall()})
+
+    @STATS.timed('db_read')
+    def load_collection_stats(self) -> tuple[int, Dict[str, int]]:
+        """
+        Load only what is needed to keep indexing into an existing index.
+        Returns (document count, word frequencies)
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT count FROM document_count')
+        row = cursor.fetchone()
+        cursor.execute('SELECT word, frequency FROM word_frequencies')
+        return (row[0] if row else 0), dict(cursor.fetchall())
+
+    @STATS.timed('db_read')
+    def load_indexer_data(self, shard: int = None, num_shards: int = 1) -> tuple[Dict[int, float], Dict[int, int], int, Dict[str, int]]:
+        """
+        Load the term statistics used for scoring; document text stays in
+        stored_fields. If shard is provided, document lengths and max term
+        frequencies are restricted to documents with doc_id % num_shards == shard,
+        while the document count and word frequencies stay global.
+        Returns (document lengths, max term frequencies, document count, word frequencies)
+        """
+        cursor = self.conn.cursor()
+        where = ''
+        params = ()
+        if shard is not None:
+            where = ' WHERE doc_id % ? = ?'
+            params = (num_shards, shard)
         
-        # Load docs
-        cursor.execute('SELECT * FROM docs')
-        docs = {}
-        for row in cursor.fetchall():
-            doc_id, title, content, title_words, content_words = row
-            docs[doc_id] = {
-                'title': title,
-                'content': content,
-                'titleWd': ast.literal_eval(title_words),
-                'contentWd': ast.literal_eval(content_words)
-            }
-        
-        # Load document lengths
-        cursor.execute('SELECT * FROM document_lengths')
-        lenDoc = {row[0]: row[1] for row in cursor.fetchall()}
+        # Load document lengths and max term frequencies
+        cursor.execute('SELECT doc_id, length, max_tf FROM document_lengths' + where, params)
+        lenDoc = {}
+        maxTf = {}
+        for doc_id, length, max_tf in cursor.fetchall():
+            lenDoc[doc_id] = length
+            maxTf[doc_id] = max_tf
         
         # Load word frequencies
         cursor.execute('SELECT * FROM word_frequencies')
@@ -214,8 +562,61 @@ class Database:
         # Load document count
         cursor.execute('SELECT count FROM document_count')
         docNo = cursor.fetchone()[0]
-        
-        return docs, lenDoc, docNo, freqWordDoc
+
+        self.check_index_format(maxTf)
+        return lenDoc, maxTf, docNo, freqWordDoc
+
+    @STATS.timed('db_read')
+    def load_document_stats(self, doc_ids: List[int]) -> tuple[Dict[int, float], Dict[int, int]]:
+        """
+        Load the lengths and max term frequencies of doc_ids only.
+        Returns (document lengths, max term frequencies)
+        """
+        cursor = self.conn.cursor()
+        doc_ids = list(doc_ids)
+        lenDoc = {}
+        maxTf = {}
+        for i in range(0, len(doc_ids), 500):
+            chunk = doc_ids[i:i + 500]
+            cursor.execute(f'SELECT doc_id, length, max_tf FROM document_lengths WHERE doc_id IN ({",".join("?" * len(chunk))})', chunk)
+            for doc_id, length, max_tf in cursor.fetchall():
+                lenDoc[doc_id] = length
+                maxTf[doc_id] = max_tf
+        self.check_index_format(maxTf)
+        return lenDoc, maxTf
+
+    @STATS.timed('db_write')
+    def save_fuzzy_index(self, fuzzy: FuzzyIndex.FuzzyIndex):
+        cursor = self.conn.cursor()
+        cursor.execute('DELETE FROM fuzzy_deletes')
+        cursor.execute('DELETE FROM fuzzy_settings')
+        cursor.executemany('''
+        INSERT INTO fuzzy_deletes (deletion, word)
+        VALUES (?, ?)
+        ''', ((deletion, word) for deletion, words in fuzzy.deletes.items() for word in words))
+        cursor.execute('''
+        INSERT INTO fuzzy_settings (max_edit, prefix_len)
+        VALUES (?, ?)
+        ''', (fuzzy.maxEdit, fuzzy.prefixLen))
+        self.conn.commit()
+
+    @STATS.timed('db_read')
+    def load_fuzzy_index(self) -> Optional[FuzzyIndex.FuzzyIndex]:
+        """
+        Load the fuzzy index saved by save_fuzzy_index.
+        Returns None if no fuzzy index has been saved.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT max_edit, prefix_len FROM fuzzy_settings')
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        fuzzy = FuzzyIndex.FuzzyIndex(maxEdit=row[0], prefixLen=row[1])
+        cursor.execute('SELECT deletion, word FROM fuzzy_deletes')
+        for deletion, word in cursor.fetchall():
+            fuzzy.deletes[deletion].add(word)
+            fuzzy.words.add(word)
+        return fuzzy
 
     def close(self):
         self.conn.close() 
\ No newline at end of file
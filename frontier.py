@@ -0,0 +1,102 @@
+import hashlib
+import math
+
+class BloomFilter:
+    """
+    Fixed-size seen-set. Membership is O(k) with k hash probes, memory is
+    fixed by capacity and errorRate, and there are no false negatives; about
+    errorRate of never-added items are reported as present once capacity
+    items have been added.
+    """
+
+    def __init__(self, capacity=1000000, errorRate=1e-4, bits=None, hashes=None, count=0):
+        if bits is None:
+            size = max(8, int(-capacity * math.log(errorRate) / (math.log(2) ** 2)))
+            bits = bytearray((size + 7) // 8)
+        self.bits = bits
+        self.size = len(bits) * 8
+        self.hashes = hashes or max(1, round(self.size / max(1, capacity) * math.log(2)))
+        self.count = count
+
+    def probes(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        isNew = False
+        for bit in self.probes(item):
+            byte, mask = bit >> 3, 1 << (bit & 7)
+            if not self.bits[byte] & mask:
+                self.bits[byte] |= mask
+                isNew = True
+        if isNew:
+            self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[bit >> 3] & (1 << (bit & 7)) for bit in self.probes(item))
+
+    def __len__(self):
+        return self.count
+
+class Frontier:
+    """
+    Crawl queue stored in the database's frontier table, with the same
+    append/popleft/len interface as the deque it replaces. URLs are queued at
+    most once. A popped URL stays pending in the table until done() is
+    called, and changes are only made durable by Database.save_checkpoint, so
+    after a crash every URL not finished by the last checkpoint is retried.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.cursor = 0  # seq of the last popped url
+
+    def append(self, url):
+        self.db.frontier_push(url)
+
+    def popleft(self):
+        row = self.db.frontier_pop(self.cursor)
+        if row is None:
+            raise IndexError("pop from an empty frontier")
+        self.cursor, url = row
+        return url
+
+    def done(self, url):
+        self.db.frontier_done(url)
+
+    def __len__(self):
+        return self.db.frontier_size(self.cursor)
+
+    def __bool__(self):
+        return self.db.frontier_pop(self.cursor) is not None
+
+class PageIndex:
+    """
+    url -> {'id', 'last_modified'} mapping for a Spider backed by a database.
+    Pages not checkpointed yet are held in memory; older ones are looked up
+    in the pages table, so memory does not grow with the size of the crawl.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.recent = {}
+
+    def __contains__(self, url):
+        return url in self.recent or self.db.lookup_page(url) is not None
+
+    def __getitem__(self, url):
+        if url in self.recent:
+            return self.recent[url]
+        row = self.db.lookup_page(url)
+        if row is None:
+            raise KeyError(url)
+        return {'id': row[0], 'last_modified': row[1]}
+
+    def __setitem__(self, url, value):
+        self.recent[url] = value
+
+    def saved(self):
+        """Called once the recent pages are in the pages table."""
+        self.recent.clear()
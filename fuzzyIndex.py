@@ -0,0 +1,108 @@
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+class FuzzyIndex:
+    """SymSpell-style deletion dictionary over the (stemmed) index vocabulary.
+
+    Every vocabulary word is stored under all the strings obtained by deleting
+    up to maxEdit characters from its first prefixLen characters. A query term
+    is looked up by generating its own deletions, so candidates are found
+    without scanning the vocabulary, and only those are verified with a real
+    edit distance.
+    """
+
+    def __init__(self, maxEdit=2, prefixLen=7):
+        self.maxEdit = maxEdit
+        self.prefixLen = prefixLen
+        self.deletes = defaultdict(set)
+        self.words = set()
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self.words
+
+    def edits(self, word, distance=None):
+        """Return every string reachable from word by deleting up to distance characters."""
+        if distance is None:
+            distance = self.maxEdit
+        result = {word}
+        frontier = {word}
+        for _ in range(distance):
+            nextFrontier = set()
+            for w in frontier:
+                if len(w) <= 1:
+                    continue
+                for i in range(len(w)):
+                    nextFrontier.add(w[:i] + w[i+1:])
+            nextFrontier -= result
+            result |= nextFrontier
+            frontier = nextFrontier
+        return result
+
+    def addWord(self, word):
+        if not word or word in self.words:
+            return
+        self.words.add(word)
+        for deletion in self.edits(word[:self.prefixLen]):
+            self.deletes[deletion].add(word)
+
+    def build(self, words: Iterable[str]):
+        for word in words:
+            self.addWord(word)
+        return self
+
+    def distance(self, a, b, maxDist):
+        """Optimal string alignment distance, or maxDist + 1 once it is exceeded."""
+        if abs(len(a) - len(b)) > maxDist:
+            return maxDist + 1
+        prevPrev = None
+        prev = list(range(len(b) + 1))
+        for i in range(1, len(a) + 1):
+            cur = [i] + [0] * len(b)
+            rowMin = i
+            for j in range(1, len(b) + 1):
+                cost = 0 if a[i-1] == b[j-1] else 1
+                cur[j] = min(prev[j] + 1, cur[j-1] + 1, prev[j-1] + cost)
+                if (prevPrev is not None and i > 1 and j > 1 and
+                        a[i-1] == b[j-2] and a[i-2] == b[j-1]):
+                    cur[j] = min(cur[j], prevPrev[j-2] + 1)
+                rowMin = min(rowMin, cur[j])
+            if rowMin > maxDist:
+                return maxDist + 1
+            prevPrev, prev = prev, cur
+        return prev[-1]
+
+    def lookup(self, term, freqWordDoc: Dict[str, int] = None, maxResults=3, budget=0.005) -> List[Tuple[str, int, int]]:
+        """
+        Find vocabulary words within maxEdit of term.
+        Only candidates at the smallest distance found are returned, the most
+        frequent (by document frequency) first. The search stops early once
+        budget seconds have elapsed and returns what it has so far.
+        Returns list of tuples containing (word, distance, document frequency)
+        """
+        if not term or not self.words:
+            return []
+        freqWordDoc = freqWordDoc or {}
+        deadline = time.perf_counter() + budget
+        best = self.maxEdit + 1
+        found = {}
+        checked: Set[str] = set()
+        for deletion in self.edits(term[:self.prefixLen]):
+            for word in self.deletes.get(deletion, ()):
+                if word in checked:
+                    continue
+                checked.add(word)
+                dist = self.distance(term, word, min(best, self.maxEdit))
+                if dist <= best and dist <= self.maxEdit:
+                    if dist < best:
+                        best = dist
+                        found = {}
+                    found[word] = dist
+            if time.perf_counter() > deadline:
+                break
+        matches = [(word, dist, freqWordDoc.get(word, 0)) for word, dist in found.items()]
+        matches.sort(key=lambda x: (-x[2], x[0]))
+        return matches[:maxResults]
@@ -1,12 +1,42 @@
 import requests
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urljoin, urlparse, urlsplit, urlunsplit
 from collections import deque
+import logging
 import os
+import re
+
+import frontier as Frontier
+import instrumentation as Instrumentation
+import simhash as SimHash
+
+STATS = Instrumentation.STATS
+log = logging.getLogger(__name__)
+
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+def normalize_url(url):
+    """
+    Canonical form of a URL, so variants of one page are crawled once:
+    lower-case scheme and host, no default port, no fragment, no repeated
+    slashes in the path. A trailing slash is kept: it is part of the path
+    relative links on the page resolve against.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    netloc = host
+    if parts.port is not None and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{host}:{parts.port}"
+    if parts.username:
+        netloc = f"{parts.username}{':' + parts.password if parts.password else ''}@{netloc}"
+    path = re.sub(r'/{2,}', '/', parts.path) or '/'
+    return urlunsplit((scheme, netloc, path, parts.query, ''))
 
 
 class Page:
-    def __init__(self, page_id, parent_id, url, title, last_modified, body):
+    def __init__(self, page_id, parent_id, url, title, last_modified, body, simhash=None, duplicate_of=None):
         self.page_id = page_id
         self.parent_id = parent_id
         self.url = url
@@ -14,6 +44,9 @@ class Page:
         self.last_modified = last_modified
         self.body = body  # 新增 body 属性，存储页面内容
         self.child_ids = []  # 存储子页面的ID
+        self.analyzed = None  # (title, body, surfaces) 停用词去除并词干化后的文本及词干的原词计数
+        self.simhash = simhash  # 正文的 SimHash 指纹
+        self.duplicate_of = duplicate_of  # 近似重复时, 规范页面的ID
 
     def __repr__(self):
         return (f"Page(id={self.page_id}, parent_id={self.parent_id}, url='{self.url}', "
@@ -22,25 +55,81 @@ class Page:
 
 
 class Spider:
-    def __init__(self, start_url, num_pages):
-        self.start_url = start_url
+    def __init__(self, start_url, num_pages, db=None, checkpoint_every=50, seen_capacity=None,
+                 duplicate_distance=6, keep_pages=True):
+        """
+        With db, the queue lives in the database's frontier table, visited URLs
+        are kept in a fixed-size Bloom filter, known pages are looked up in the
+        pages table, and crawl() checkpoints pages and state every
+        checkpoint_every pages. The Bloom filter holds seen_capacity URLs
+        (default: twice num_pages, at least 10000) and is only rewritten by
+        checkpoints that saw new URLs. A Spider created on a database with an
+        unfinished checkpoint for the same start_url resumes from it;
+        otherwise the database's previous crawl is discarded. With keep_pages=False, pages
+        and relations are dropped from memory once checkpointed.
+        Pages whose text SimHash is within duplicate_distance bits of an earlier
+        page are marked as its near-duplicates (None turns this off).
+        """
+        self.start_url = normalize_url(start_url)
         self.num_pages = num_pages
-        self.visited = set()
-        self.page_index = {}
+        self.db = db
+        self.checkpoint_every = checkpoint_every
+        self.keep_pages = keep_pages
+        self.resumed = False
+        self.finished = False  # set when crawling ends normally, so the next Spider starts over
+        self.page_index = {}  # url -> {'id', 'last_modified'}
         self.parent_child = {}
         self.id_to_url = {}  # ID 和 URL 的对应关系
         self.inverted_index = {}  # 倒排索引
-        self.queue = deque([start_url])
         self.page_id_counter = 0
         self.pages = []  # 用于存储页面对象
+        self.page_by_id = {}
+        self.unsaved = 0  # pages at the end of self.pages not checkpointed yet
+        self.duplicates = SimHash.SimHashIndex(maxDistance=duplicate_distance) if duplicate_distance is not None else None
+        if db is None:
+            self.visited = set()
+            self.queue = deque([self.start_url])
+            return
+        self.queue = Frontier.Frontier(db)
+        self.page_index = Frontier.PageIndex(db)
+        state = db.load_crawl_state()
+        if state.get('start_url') == self.start_url and not state.get('finished'):
+            self.resumed = True
+            self.page_id_counter = state['page_id_counter']
+            self.visited = Frontier.BloomFilter(bits=bytearray(state['visited_bits']),
+                                                hashes=state['visited_hashes'], count=state['visited_count'])
+            self.saved_visited = self.visited.count
+            if self.duplicates is not None:
+                for page_id, fingerprint, duplicate_of in db.load_simhashes():
+                    if page_id >= self.page_id_counter:
+                        continue
+                    if duplicate_of is None:
+                        self.duplicates.addCanonical(page_id, fingerprint)
+                    else:
+                        self.duplicates.addDuplicate(page_id, duplicate_of)
+            log.info("Resuming crawl of %s: %d visited, %d queued", self.start_url, len(self.visited), len(self.queue))
+        else:
+            db.clear_crawl_state()
+            # Only fetched URLs are added, and a crawl fetches at most num_pages
+            self.visited = Frontier.BloomFilter(seen_capacity or max(2 * num_pages, 10000))
+            self.saved_visited = None  # visited.count when the filter was last checkpointed
+            self.queue.append(self.start_url)
 
     def fetch_page(self, url):
-        try:
-            response = requests.get(url)
-            response.raise_for_status()  # Raise an error for bad responses
-            return response.text, response.headers.get('Last-Modified')
-        except (requests.RequestException, ValueError):
-            return None, None
+        """
+        Returns (html, Last-Modified, base url), or (None, None, None) on error.
+        The base url is the one the page was served from after redirects;
+        relative links on the page resolve against it.
+        """
+        with STATS.timer('fetch'):
+            try:
+                response = requests.get(url)
+                response.raise_for_status()  # Raise an error for bad responses
+                STATS.count('pages_fetched')
+                return response.text, response.headers.get('Last-Modified'), response.url
+            except (requests.RequestException, ValueError):
+                STATS.count('fetch_errors')
+                return None, None, None
 
     def extract_text(self, html):
         """提取页面的文本内容"""
@@ -51,7 +140,7 @@ class Spider:
         soup = BeautifulSoup(html, 'html.parser')
         links = set()
         for a_tag in soup.find_all('a', href=True):
-            full_url = urljoin(base_url, a_tag['href'])
+            full_url = normalize_url(urljoin(base_url, a_tag['href']))
             if self.is_same_domain(full_url):
                 links.add(full_url)
         return links
@@ -64,13 +153,21 @@ class Spider:
         if url in self.page_index:
             return self.page_index[url]['id']  # 如果存在，返回已分配的ID
 
+        with STATS.timer('parse'):
+            title = self.extract_title(content)  # 提取页面标题
+            body = self.extract_text(content)
+        fingerprint = None
+        if self.duplicates is not None:
+            with STATS.timer('simhash'):
+                fingerprint = SimHash.simhash(body, bits=self.duplicates.bits)
+        return self.add_page(url, title, body, last_modified, fingerprint).page_id
+
+    def add_page(self, url, title, body, last_modified, fingerprint=None):
+        """Record an already parsed page under a new ID and return it."""
         # 如果URL不存在，分配新的ID
         page_id = self.page_id_counter
-        title = self.extract_title(content)  # 提取页面标题
-        body = self.extract_text(content)
         self.page_index[url] = {
             'id': page_id,
-            'content': content,
             'last_modified': last_modified
         }
 
@@ -79,7 +176,14 @@ class Spider:
 
         # 创建页面对象并存储
         page = Page(page_id, None, url, title, last_modified, body)
+        if self.duplicates is not None:
+            page.simhash = fingerprint
+            page.duplicate_of = self.duplicates.add(page_id, fingerprint)
+            if page.duplicate_of is not None:
+                STATS.count('near_duplicates')
         self.pages.append(page)
+        self.page_by_id[page_id] = page
+        self.unsaved += 1
 
         # # 保存网页内容到本地文件
         # file_name = f"page_{page_id}.html"  # 使用页面ID作为文件名
@@ -87,19 +191,22 @@ class Spider:
         #     file.write(content)  # 将网页内容写入文件
 
         self.page_id_counter += 1
-        return page_id
+        return page
 
     def extract_title(self, html):
         soup = BeautifulSoup(html, 'html.parser')
         title_tag = soup.find('title')
-        return title_tag.string if title_tag else 'No Title'
+        if not title_tag:
+            return 'No Title'
+        # A plain str: the tag's NavigableString keeps the whole parse tree alive (and pickled)
+        return str(title_tag.string) if title_tag.string is not None else None
 
     def extract_links(self, html, base_url):
         soup = BeautifulSoup(html, 'html.parser')
         links = set()
         link_texts = {}  # 用于存储链接及其对应的文本
         for a_tag in soup.find_all('a', href=True):
-            full_url = urljoin(base_url, a_tag['href'])
+            full_url = normalize_url(urljoin(base_url, a_tag['href']))
             if self.is_same_domain(full_url):
                 links.add(full_url)
                 link_texts[full_url] = a_tag.get_text(strip=True)  # 提取链接文本
@@ -116,27 +223,72 @@ class Spider:
         self.inverted_index[child_id].append(parent_id)
 
         # 更新子页面的父页面ID和子页面ID
-        for page in self.pages:
-            if page.page_id == child_id:
-                page.parent_id = parent_id
-                page.child_ids.append(child_id)  # 添加子页面ID
-                break
+        page = self.page_by_id.get(child_id)
+        if page is not None:
+            page.parent_id = parent_id
+            page.child_ids.append(child_id)  # 添加子页面ID
+
+    def checkpoint(self):
+        """Make the pages and frontier so far durable; a new Spider on the same database resumes from here."""
+        if self.db is None:
+            return
+        state = {
+            'start_url': self.start_url,
+            'page_id_counter': self.page_id_counter,
+            'finished': self.finished,
+        }
+        # The filter's bits only change when its count does; don't rewrite them otherwise
+        if self.visited.count != self.saved_visited:
+            state.update(visited_bits=bytes(self.visited.bits), visited_hashes=self.visited.hashes,
+                         visited_count=self.visited.count)
+            self.saved_visited = self.visited.count
+        self.db.save_checkpoint(self.pages[len(self.pages) - self.unsaved:], state)
+        self.unsaved = 0
+        self.page_index.saved()
+        if not self.keep_pages:
+            self.pages = []
+            self.page_by_id.clear()
+            self.id_to_url.clear()
+            self.parent_child.clear()
+            self.inverted_index.clear()
+        STATS.count('checkpoints')
+
+    def finish_url(self, url):
+        """A url taken from the queue has been handled, whether or not it could be fetched."""
+        if self.db is not None:
+            self.queue.done(url)
 
     def crawl(self):
+        for _ in self.crawl_batches():
+            if self.unsaved >= self.checkpoint_every:
+                self.checkpoint()
+        self.checkpoint()
+        self.report()
+
+    def crawl_batches(self):
+        """
+        Crawl, yielding the list of pages created while handling each visited
+        url (the page and its newly seen children). Between batches the crawl
+        state is consistent, so callers may checkpoint there.
+        """
         while self.queue and len(self.visited) < self.num_pages:
             current_url = self.queue.popleft()
             if current_url in self.visited:
+                self.finish_url(current_url)
                 continue
 
-            html, last_modified = self.fetch_page(current_url)
+            html, last_modified, base_url = self.fetch_page(current_url)
             if html is None:
+                self.finish_url(current_url)
                 continue
 
+            first_new_id = self.page_id_counter
             self.visited.add(current_url)
             page_id = self.index_page(current_url, html, last_modified)
 
             # Extract child links and their texts
-            child_links, link_texts = self.extract_links(html, current_url)
+            with STATS.timer('parse'):
+                child_links, link_texts = self.extract_links(html, base_url)
             for link in child_links:
                 if link not in self.visited:
                     if link not in self.page_index or \
@@ -144,22 +296,31 @@ class Spider:
                              last_modified and
                              self.page_index[link]['last_modified'] < last_modified):
                         self.queue.append(link)
-                        c_html, c_last_modified = self.fetch_page(link)
+                        c_html, c_last_modified, _ = self.fetch_page(link)
                         # child_id = self.index_page(link, '', last_modified)  # Fetch child later
                         child_id = self.index_page(link, c_html, last_modified)
 
                         # 使用链接文本作为子页面标题
                         link_title = link_texts.get(link, 'No Title')
-                        self.pages[child_id].title = link_title  # 更新子页面标题
+                        if child_id in self.page_by_id:
+                            self.page_by_id[child_id].title = link_title  # 更新子页面标题
 
                         self.add_relation(page_id, child_id)  # 关联子页面
 
+            self.finish_url(current_url)
+            yield [self.page_by_id[i] for i in range(first_new_id, self.page_id_counter)]
+        self.finished = True
+
+    def report(self):
         print("Crawling completed.")
         print(f"Total pages indexed: {len(self.visited)}")
-        print(f"Parent-Child Relations: {self.parent_child}")
-        print(f"ID to URL Mapping: {self.id_to_url}")  # 打印 ID 和 URL 的对应关系
-        print(f"Inverted Index: {self.inverted_index}")  # 打印倒排索引
-        print(f"Pages: {self.pages}")  # 打印页面对象数组
+        if self.duplicates is not None:
+            print(f"Near-duplicates: {self.duplicates.stats()}")
+        # Large dumps only at DEBUG level; the arguments are not formatted otherwise
+        log.debug("Parent-Child Relations: %s", self.parent_child)
+        log.debug("ID to URL Mapping: %s", self.id_to_url)  # 打印 ID 和 URL 的对应关系
+        log.debug("Inverted Index: %s", self.inverted_index)  # 打印倒排索引
+        log.debug("Pages: %s", self.pages)  # 打印页面对象数组
 
 
 if __name__ == "__main__":
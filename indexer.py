@@ -1,5 +1,5 @@
 import math, re
-from collections import defaultdict
+from collections import Counter, defaultdict
 from typing import List
 
 class Porter:
@@ -254,13 +254,23 @@ class Porter:
         return s
 
 import getPage as GetPage
+import fuzzyIndex as FuzzyIndex
+import instrumentation as Instrumentation
+
+STATS = Instrumentation.STATS
 
 class File:
     def __init__(self, page: GetPage.Page):
         self.page = page
         self.porter = Porter()
-        self.title = " ".join(self.stem(self.stop(page.title.split())))
-        self.body = " ".join(self.stem(self.stop(page.body.split())))
+        if page.analyzed is not None:
+            # Already stopped and stemmed by the crawl pipeline
+            self.title, self.body, self.surfaces = page.analyzed
+        else:
+            with STATS.timer('analyze'):
+                self.surfaces = Counter()
+                self.title = " ".join(self.analyze(page.title.split()))
+                self.body = " ".join(self.analyze(page.body.split()))
         self.file_id = page.page_id
 
     def __repr__(self):
@@ -272,29 +282,42 @@ class File:
     
     def stem(self, text_list: List[str]):
         return [self.porter.strip_affixes(word) for word in text_list]
+
+    def analyze(self, text_list: List[str]):
+        """Stop and stem text_list, counting in surfaces the (stem, word) pairs it was stemmed from."""
+        words = self.stop(text_list)
+        stems = self.stem(words)
+        self.surfaces.update((stem, self.porter.clean(word)) for stem, word in zip(stems, words) if stem)
+        return stems
     
+    stop_words = None
+
     def get_stop_words_set():
-        stopwords = set(open("stopwords.txt").read().split("\n"))
-        return stopwords
+        # Read once per process; stop() runs for every title and body
+        if File.stop_words is None:
+            File.stop_words = set(open("stopwords.txt").read().split("\n"))
+        return File.stop_words
     
 class Indexer:
-    def __init__(self):
+    def __init__(self, fuzzy=False):
         self.invInd = defaultdict(dict) 
-        self.docs = {}  
         self.lenDoc = {}  
+        self.maxTf = {}  # docId -> count of the document's most frequent word
         self.docNo = 0
         self.freqWordDoc = defaultdict(int)
+        self.surfaces = Counter()  # (stem, word) -> occurrences of word in the indexed text
+        # Optional typo-tolerance index, kept in step with the vocabulary
+        self.fuzzy = FuzzyIndex.FuzzyIndex() if fuzzy else None
 
     def preText(self, words):
         return re.findall(r'\b\w+\b', words.lower())
     
-    def findLenDoc(self, docId):
-        doc_info = self.docs[docId]
-        allWd = doc_info['titleWd'] + doc_info['contentWd']
+    def findLenDoc(self, allWd):
+        counts = Counter(allWd)
+        tfMax = max(counts.values(), default=1)
         wdWeights = {}
         for word in set(allWd):
-            tf = allWd.count(word)
-            tfMax = max([allWd.count(t) for t in set(allWd)] or [1])
+            tf = counts[word]
             idf = math.log(self.docNo / (self.freqWordDoc[word] or 1))
             wdWeights[word] = idf* (tf / tfMax) 
         len1 = 0
@@ -302,27 +325,90 @@ class Indexer:
             len1 += w**2
         return math.sqrt(len1) 
 
-    def indexDoc(self, docID, title, content):
+    def addPosting(self, word, docID):
+        self.invInd[word][docID] = {'titlePos': [], 'contentPos': []}
+        self.freqWordDoc[word] += 1
+        if self.fuzzy is not None and self.freqWordDoc[word] == 1:
+            self.fuzzy.addWord(word)
+
+    def buildFuzzyIndex(self):
+        """Build the fuzzy index from the current vocabulary, e.g. after loading from the database."""
+        self.fuzzy = FuzzyIndex.FuzzyIndex().build(self.invInd.keys())
+        return self.fuzzy
+
+    def surfaceForms(self):
+        """The word each stem was most often written as, to show users instead of the stem."""
+        forms = {}
+        for (stem, word), count in self.surfaces.items():
+            # Ties go to the alphabetically first word, so the choice doesn't depend on indexing order
+            best = forms.get(stem)
+            if best is None or (-count, word) < (-best[1], best[0]):
+                forms[stem] = (word, count)
+        return {stem: word for stem, (word, _) in forms.items()}
+
+    @STATS.timed('index')
+    def indexDoc(self, docID, title, content, surfaces=None):
+        if surfaces:
+            self.surfaces.update(surfaces)
         titleWd = self.preText(title)
         contentWd = self.preText(content)
         self.docNo += 1
-        self.docs[docID] = {
-            'title': title,
-            'content': content,
-            'titleWd': titleWd,
-            'contentWd': contentWd
-        }
         for position, word in enumerate(titleWd):
             if docID not in self.invInd[word]:
-                self.invInd[word][docID] = {'titlePos': [], 'contentPos': []}
-                self.freqWordDoc[word] += 1
+                self.addPosting(word, docID)
             self.invInd[word][docID]['titlePos'].append(position)
         for position, word in enumerate(contentWd):
             if docID not in self.invInd[word]:
-                self.invInd[word][docID] = {'titlePos': [], 'contentPos': []}
-                self.freqWordDoc[word] += 1
+                self.addPosting(word, docID)
             self.invInd[word][docID]['contentPos'].append(position)
-        self.lenDoc[docID] = self.findLenDoc(docID)
+        allWd = titleWd + contentWd
+        self.maxTf[docID] = max(Counter(allWd).values(), default=1)
+        self.lenDoc[docID] = self.findLenDoc(allWd)
+
+    def loadTerms(self, db, words):
+        """Load the postings of words, and the lengths of the documents they occur in, from the database."""
+        postings = db.load_inverted_index(words=[w for w in set(words) if w not in self.invInd])
+        self.invInd.update(postings)
+        docIds = {docId for docs in postings.values() for docId in docs if docId not in self.lenDoc}
+        lenDoc, maxTf = db.load_document_stats(docIds)
+        self.lenDoc.update(lenDoc)
+        self.maxTf.update(maxTf)
+
+    def drain(self):
+        """
+        Hand over the lengths and postings of documents indexed since the last
+        drain and forget them. docNo and freqWordDoc are kept, so documents
+        indexed afterwards get the same weights as in one large build.
+        Returns (lenDoc, maxTf, invInd, surfaces)
+        """
+        batch = self.lenDoc, self.maxTf, self.invInd, self.surfaces
+        self.lenDoc, self.maxTf, self.invInd, self.surfaces = {}, {}, defaultdict(dict), Counter()
+        return batch
+
+def load_collection(db, fuzzy=False):
+    """
+    An Indexer with only the document count, word frequencies and (if
+    fuzzy) the fuzzy index loaded. Add the postings a search needs with
+    loadTerms, instead of loading the whole index.
+    """
+    indexer = Indexer()
+    docNo, freqWordDoc = db.load_collection_stats()
+    indexer.docNo = docNo
+    indexer.freqWordDoc.update(freqWordDoc)
+    indexer.surfaces = db.load_surface_forms()
+    if fuzzy:
+        indexer.fuzzy = db.load_fuzzy_index() or FuzzyIndex.FuzzyIndex().build(freqWordDoc.keys())
+    return indexer
+
+def load_from_database(db, fuzzy=False, shard=None, num_shards=1):
+    """Rebuild an Indexer from the tables written by Database.save_indexer_data and save_inverted_index."""
+    indexer = Indexer()
+    indexer.lenDoc, indexer.maxTf, indexer.docNo, indexer.freqWordDoc = db.load_indexer_data(shard, num_shards)
+    indexer.invInd = db.load_inverted_index(shard, num_shards)
+    indexer.surfaces = db.load_surface_forms()
+    if fuzzy:
+        indexer.fuzzy = db.load_fuzzy_index() or indexer.buildFuzzyIndex()
+    return indexer
 
 if __name__ == "__main__":
     file1 = File("This is the Test page for a crawler", "Before getting the Admission of CSE department of HKUST, You should read through these international news and these books.")
@@ -0,0 +1,175 @@
+import atexit
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+class NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NULL_TIMER = NullTimer()
+
+class StageTimer:
+    __slots__ = ('stats', 'name', 'start')
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stats.record(self.name, time.perf_counter() - self.start, self.stats.timers)
+        return False
+
+class Instrumentation:
+    """
+    Per-stage timers, counters and value distributions for crawl, index, store and search.
+    Everything is a no-op until enable() is called: timer() then returns a
+    shared do-nothing context manager and count()/observe() return at once.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.printsAtExit = False
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.timers = {}    # name -> [count, total seconds, max seconds]
+            self.values = {}    # name -> [count, total, max]
+            self.counters = {}
+
+    def enable(self, printAtExit=False):
+        self.enabled = True
+        # Enabled by both SEARCH_ENGINE_STATS and --stats, but reported once
+        if printAtExit and not self.printsAtExit:
+            self.printsAtExit = True
+            atexit.register(lambda: print(self.report()))
+
+    def disable(self):
+        self.enabled = False
+
+    def timer(self, name):
+        if not self.enabled:
+            return NULL_TIMER
+        return StageTimer(self, name)
+
+    def timed(self, name):
+        """Decorator timing every call of a function under name."""
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - start, self.timers)
+            return wrapper
+        return decorate
+
+    def recordTime(self, name, seconds):
+        """Add a duration measured elsewhere, e.g. in a worker process, to timer name."""
+        if not self.enabled:
+            return
+        self.record(name, seconds, self.timers)
+
+    def record(self, name, value, table):
+        with self.lock:
+            entry = table.get(name)
+            if entry is None:
+                table[name] = [1, value, value]
+            else:
+                entry[0] += 1
+                entry[1] += value
+                if value > entry[2]:
+                    entry[2] = value
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, value):
+        """Record one value of a distribution, e.g. candidates scored by one query."""
+        if not self.enabled:
+            return
+        self.record(name, value, self.values)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'timers': {name: {'count': c, 'total_s': total, 'mean_ms': total / c * 1000, 'max_ms': mx * 1000}
+                           for name, (c, total, mx) in self.timers.items()},
+                'values': {name: {'count': c, 'total': total, 'mean': total / c, 'max': mx}
+                           for name, (c, total, mx) in self.values.items()},
+                'counters': dict(self.counters),
+            }
+
+    def report(self):
+        snap = self.snapshot()
+        lines = ["======================= Stats ======================="]
+        for name, t in sorted(snap['timers'].items()):
+            lines.append(f"{name:20} {t['count']:8d} calls {t['total_s']:10.3f}s total {t['mean_ms']:10.3f}ms mean {t['max_ms']:10.3f}ms max")
+        for name, v in sorted(snap['values'].items()):
+            lines.append(f"{name:20} {v['count']:8d} obs   {v['total']:10.0f} total {v['mean']:10.1f} mean {v['max']:10.0f} max")
+        for name, n in sorted(snap['counters'].items()):
+            lines.append(f"{name:20} {n:8d}")
+        return "\n".join(lines)
+
+    @contextmanager
+    def profile(self, output=None, sortBy='cumulative', limit=30):
+        """Run the enclosed block under cProfile. Stats go to output (a .prof file) or are printed."""
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+            if output:
+                profiler.dump_stats(output)
+            else:
+                stream = io.StringIO()
+                pstats.Stats(profiler, stream=stream).sort_stats(sortBy).print_stats(limit)
+                print(stream.getvalue())
+
+    @contextmanager
+    def trace_memory(self, limit=15):
+        """Run the enclosed block under tracemalloc and print the top allocation sites."""
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            if started:
+                tracemalloc.stop()
+            print(f"Traced memory: current {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB")
+            for stat in snapshot.statistics('lineno')[:limit]:
+                print(stat)
+
+STATS = Instrumentation()
+if os.environ.get('SEARCH_ENGINE_STATS'):
+    STATS.enable(printAtExit=True)
+
+def configure_logging(level='WARNING'):
+    logging.basicConfig(level=getattr(logging, str(level).upper(), logging.WARNING),
+                        format='%(levelname)s %(name)s: %(message)s')
@@ -0,0 +1,155 @@
+import argparse
+import json
+import math
+import multiprocessing as mp
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import database as Database
+import indexer as Indexer
+import searchEngine as SearchEngine
+
+from benchmarks.stats import latency_summary
+
+def queries_from_database(db) -> List[str]:
+    """Every logged search in the order it was made."""
+    return db.load_searches()
+
+def queries_from_file(path) -> List[str]:
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def replay(engine, items, startAt, maxResults):
+    """
+    Run (offset, query) items in order, starting at startAt. With an offset
+    the query is due at startAt + offset and its latency is measured from
+    then, so time spent waiting behind slow queries counts (no coordinated
+    omission).
+    Returns list of (query, latency seconds, candidates, results)
+    """
+    measured = []
+    delay = startAt - time.time()
+    if delay > 0:
+        time.sleep(delay)
+    for offset, query in items:
+        if offset is not None:
+            due = startAt + offset
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        else:
+            due = time.time()
+        results = engine.search(query, maxResults)
+        latency = time.time() - due
+        allWd, _ = engine.parseQuery(query)
+        measured.append((query, latency, len(engine.candidateDocs(allWd)), len(results)))
+    return measured
+
+workerEngine = None
+
+def init_process(db_name, ready):
+    global workerEngine
+    db = Database.Database(db_name)
+    workerEngine = SearchEngine.SearchEngine(Indexer.load_from_database(db))
+    db.close()
+    ready.wait()
+
+def replay_in_process(args):
+    items, startAt, maxResults = args
+    return replay(workerEngine, items, startAt, maxResults)
+
+def schedule(queries, total, rate):
+    """Cycle through queries until total are scheduled; offsets are None at max throughput."""
+    items = []
+    for i in range(total):
+        offset = i / rate if rate else None
+        items.append((offset, queries[i % len(queries)]))
+    return items
+
+def histogram(latencies, buckets=12):
+    """Text histogram over log-spaced millisecond buckets."""
+    if not latencies:
+        return ""
+    values = [max(l * 1000, 1e-3) for l in latencies]
+    low, high = math.log10(min(values)), math.log10(max(values))
+    width = (high - low) / buckets or 1
+    counts = [0] * buckets
+    for v in values:
+        counts[min(buckets - 1, int((math.log10(v) - low) / width))] += 1
+    peak = max(counts)
+    lines = []
+    for i, count in enumerate(counts):
+        upper = 10 ** (low + (i + 1) * width)
+        lines.append(f"<= {upper:10.3f} ms {count:7d} {'#' * round(40 * count / peak)}")
+    return "\n".join(lines)
+
+def run(db_name, queries, total, workers, rate=None, processes=False, maxResults=50, slowest=10):
+    items = schedule(queries, total, rate)
+    slices = [items[i::workers] for i in range(workers)]
+    if processes:
+        ctx = mp.get_context()
+        ready = ctx.Barrier(workers + 1)
+        with ctx.Pool(workers, initializer=init_process, initargs=(db_name, ready)) as pool:
+            # The clock starts once every worker has loaded its index
+            ready.wait()
+            startAt = time.time() + 0.1
+            parts = pool.map(replay_in_process, [(s, startAt, maxResults) for s in slices])
+    else:
+        db = Database.Database(db_name)
+        engine = SearchEngine.SearchEngine(Indexer.load_from_database(db))
+        db.close()
+        startAt = time.time() + 0.1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            parts = list(executor.map(lambda s: replay(engine, s, startAt, maxResults), slices))
+    # Every worker waits for startAt, so the lead-in before it is not part of the run
+    elapsed = time.time() - startAt
+    measured = [m for part in parts for m in part]
+    latencies = [latency for _, latency, _, _ in measured]
+    slowestQueries = sorted(measured, key=lambda m: m[1], reverse=True)[:slowest]
+    return {
+        'config': {'queries': len(measured), 'distinct_queries': len(set(queries)), 'workers': workers,
+                   'mode': 'processes' if processes else 'threads', 'rate': rate},
+        'elapsed_s': elapsed,
+        'throughput_qps': len(measured) / elapsed if elapsed else 0.0,
+        'latency': latency_summary(latencies),
+        'slowest': [{'query': q, 'latency_ms': l * 1000, 'candidates': c, 'results': r} for q, l, c, r in slowestQueries],
+        'histogram': histogram(latencies),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Replay logged queries against a built index')
+    parser.add_argument('--db', default='search_engine.db', help='Database with the index (and the query log)')
+    parser.add_argument('--queries-file', help='Read queries from this file, one per line, instead of search_results')
+    parser.add_argument('--total', type=int, help='Queries to run, cycling through the log (default: the log once)')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--processes', action='store_true', help='Use worker processes, each with its own index copy')
+    parser.add_argument('--rate', type=float, help='Fixed arrival rate in queries per second (default: max throughput)')
+    parser.add_argument('--max-results', type=int, default=50)
+    parser.add_argument('--slowest', type=int, default=10)
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    if args.queries_file:
+        queries = queries_from_file(args.queries_file)
+    else:
+        db = Database.Database(args.db)
+        queries = queries_from_database(db)
+        db.close()
+    if not queries:
+        parser.error("no queries to replay")
+
+    report = run(args.db, queries, args.total or len(queries), args.workers, args.rate,
+                 args.processes, args.max_results, args.slowest)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        config = report['config']
+        print(f"{config['queries']} queries ({config['distinct_queries']} distinct), {config['workers']} {config['mode']}, "
+              f"{'rate ' + str(config['rate']) + '/s' if config['rate'] else 'max throughput'}")
+        print(f"Throughput: {report['throughput_qps']:.1f} queries/s over {report['elapsed_s']:.2f}s")
+        print("Latency: " + ", ".join(f"{k} {v:.3f}" for k, v in report['latency'].items()))
+        print(report['histogram'])
+        print("Slowest queries:")
+        for s in report['slowest']:
+            print(f"{s['latency_ms']:10.3f} ms {s['candidates']:7d} candidates {s['results']:4d} results  {s['query']}")
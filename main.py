@@ -2,77 +2,176 @@ import getPage as GetPage
 import indexer as Indexer
 import searchEngine as SearchEngine
 import database as Database
+import autocomplete as Autocomplete
+import queryLogger as QueryLogger
+import instrumentation as Instrumentation
+import crawlPipeline as CrawlPipeline
+import fuzzyIndex as FuzzyIndex
 import argparse
+import contextlib
+import logging
 
 from typing import List
 
-def main(load_from_db: bool = False):
+log = logging.getLogger(__name__)
+
+def stream_index(db, spider, fuzzy: bool = False, parse_workers: int = 0, batch_size: int = 200):
+    """
+    Crawl and index in one pass with bounded memory. Pages are analyzed and
+    indexed as they arrive; every batch_size pages the new documents and
+    postings are appended to the database in the same transaction as the
+    crawl checkpoint, and dropped from memory. A resumed crawl keeps indexing
+    into the index built so far.
+    """
+    indexer = Indexer.Indexer()
+    if spider.resumed:
+        docNo, freqWordDoc = db.load_collection_stats()
+        indexer.docNo = docNo
+        indexer.freqWordDoc.update(freqWordDoc)
+    else:
+        db.clear_index()
+    if parse_workers:
+        batches = CrawlPipeline.crawl_iter(spider, parsers=parse_workers)
+    else:
+        batches = spider.crawl_batches()
+
+    def flush():
+        lenDoc, maxTf, invInd, surfaces = indexer.drain()
+        db.append_indexer_batch(lenDoc, maxTf, invInd, indexer.docNo, commit=False)
+        db.save_surface_forms(surfaces, commit=False)
+        # Commits the batch together with the pages and frontier it came from
+        spider.checkpoint()
+
+    for pages in batches:
+        for page in pages:
+            if page.duplicate_of is not None:
+                # Near-duplicate of an earlier page; searches find the canonical page instead
+                continue
+            file = Indexer.File(page)
+            indexer.indexDoc(file.file_id, file.title, file.body, file.surfaces)
+        if spider.unsaved >= batch_size:
+            flush()
+    flush()
+    spider.report()
+    if fuzzy:
+        db.save_fuzzy_index(FuzzyIndex.FuzzyIndex().build(indexer.freqWordDoc.keys()))
+    print(f"Indexed {indexer.docNo} documents, {len(indexer.freqWordDoc)} terms")
+
+def main(load_from_db: bool = False, fuzzy: bool = False, fresh_crawl: bool = False, parse_workers: int = 0,
+         stream: bool = False, batch_size: int = 200, duplicate_distance: int = 6):
     # Initialize database
     db = Database.Database()
     
     if load_from_db:
         print("======================= Loading Database =======================")
         # Load indexer data from database
-        docs, lenDoc, docNo, freqWordDoc = db.load_indexer_data()
-        invInd = db.load_inverted_index()
+        indexer = Indexer.load_from_database(db, fuzzy=fuzzy)
 
-        print(docs)
-        print(lenDoc)
-        print(docNo)
-        print(freqWordDoc)
-        print(invInd)
-        
-        # Create indexer with loaded data
-        indexer = Indexer.Indexer()
-        indexer.docs = docs
-        indexer.lenDoc = lenDoc
-        indexer.docNo = docNo
-        indexer.freqWordDoc = freqWordDoc
-        indexer.invInd = invInd
+        print(f"Loaded {indexer.docNo} documents, {len(indexer.invInd)} terms")
+        log.debug("Document lengths: %s", indexer.lenDoc)
+        log.debug("Max term frequencies: %s", indexer.maxTf)
+        log.debug("Word frequencies: %s", indexer.freqWordDoc)
+        log.debug("Inverted index: %s", indexer.invInd)
         
     else:
         print("======================= Crawler =======================")
         start_url = 'https://www.cse.ust.hk/~kwtleung/COMP4321/testpage.htm'
         num_pages = 10
-        spider = GetPage.Spider(start_url, num_pages)
-        spider.crawl()
-        
-        # Save crawled pages to database
-        db.save_pages(spider.pages)
+        if fresh_crawl:
+            db.clear_crawl_state()
+            # A fresh crawl is how an index from before stored_fields is rebuilt
+            db.drop_legacy_tables()
+        # The spider checkpoints pages and its frontier to the database, and resumes an interrupted crawl
+        spider = GetPage.Spider(start_url, num_pages, db=db, keep_pages=not stream,
+                                duplicate_distance=duplicate_distance if duplicate_distance >= 0 else None)
+        if stream:
+            print("======================= Streaming Indexer =======================")
+            stream_index(db, spider, fuzzy, parse_workers, batch_size)
+            # Postings are loaded below for the queries' terms only, never the whole index
+            indexer = Indexer.load_collection(db, fuzzy=fuzzy)
+        else:
+            if parse_workers:
+                # Fetch on threads, parse and analyze on a process pool
+                CrawlPipeline.crawl(spider, parsers=parse_workers)
+            else:
+                spider.crawl()
+            # This crawl's pages, including those fetched before a resume, have ids 0..page_id_counter-1.
+            # Pages crawled in this run are taken from memory so pipeline analysis is reused.
+            crawled = {page.page_id: page for page in spider.pages}
+            pages = [crawled.get(page.page_id, page) for page in db.load_pages() if page.page_id < spider.page_id_counter]
 
-        print("\n\n\n")
-        print("======================= Stop Remove, Stem & Indexer =======================")
-        files: List[Indexer.File] = []
-        for page in spider.pages:
-            file = Indexer.File(page)
-            files.append(file)
-            print(f"ID: {file.file_id}, Title: {file.title}, Body: {file.body}")
-        indexer = Indexer.Indexer()
-        for file in files:
-            indexer.indexDoc(file.file_id, file.title, file.body)
+            print("\n\n\n")
+            print("======================= Stop Remove, Stem & Indexer =======================")
+            files: List[Indexer.File] = []
+            for page in pages:
+                if page.duplicate_of is not None:
+                    # Near-duplicate of an earlier page; searches find the canonical page instead
+                    continue
+                file = Indexer.File(page)
+                files.append(file)
+                log.debug("ID: %s, Title: %s, Body: %s", file.file_id, file.title, file.body)
+            indexer = Indexer.Indexer(fuzzy=fuzzy)
+            for file in files:
+                indexer.indexDoc(file.file_id, file.title, file.body, file.surfaces)
 
-        # Save indexer data to database
-        db.save_indexer_data(indexer.docs, indexer.lenDoc, indexer.docNo, indexer.freqWordDoc)
-        db.save_inverted_index(indexer.invInd)
+            # Save indexer data to database, replacing any earlier index
+            db.clear_index()
+            db.save_indexer_data(indexer.lenDoc, indexer.maxTf, indexer.docNo, indexer.freqWordDoc)
+            db.save_inverted_index(indexer.invInd)
+            db.save_surface_forms(indexer.surfaces)
+            if indexer.fuzzy is not None:
+                db.save_fuzzy_index(indexer.fuzzy)
     print("\n\n\n")
     print("======================= Search Engine =======================")
     engine = SearchEngine.SearchEngine(indexer)
+    queries = ["hong kong", '"science"', "universities", "hong kong universities"]
+    if stream and not load_from_db:
+        indexer.loadTerms(db, [word for query in queries for word in engine.parseQuery(query)[0]])
+    completer = Autocomplete.Autocomplete()
+    completer.addQueries(db.load_query_counts())
+    completer.addVocabulary(indexer.freqWordDoc, indexer.surfaceForms())
+    logger = QueryLogger.QueryLogger()
     
     # Perform searches and save results
-    queries = ["hong kong", '"science"', "universities", "hong kong universities"]
     for query in queries:
         results = engine.search(query)
         # Convert results to list of (doc_id, score) tuples
         result_tuples = [(doc_id, score) for (doc_id, score, wordFreq) in results]
-        db.save_search_results(query, result_tuples)
+        logger.log(query, result_tuples)
+        completer.addQuery(query)
         print(f"Search for '{query}':", result_tuples)
+
+    for prefix in ["h", "hong ", "uni"]:
+        print(f"Completions for '{prefix}':", completer.complete(prefix, 5))
     
-    # Close database connection
+    # Flush logged queries and close database connection
+    logger.close()
     db.close()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Search Engine')
     parser.add_argument('--load-db', action='store_true', help='Load indexer data from database instead of crawling')
+    parser.add_argument('--fuzzy', action='store_true', help='Expand misspelled query terms using a fuzzy term index')
+    parser.add_argument('--fresh-crawl', action='store_true', help='Discard any checkpointed crawl and start from the start URL')
+    parser.add_argument('--parse-workers', type=int, default=0, help='Parse and analyze pages on this many processes while threads fetch')
+    parser.add_argument('--stream', action='store_true', help='Index pages while crawling and write the index in batches, keeping memory bounded')
+    parser.add_argument('--duplicate-distance', type=int, default=6,
+                        help='Mark pages whose SimHash is within this many bits of an earlier page as near-duplicates; -1 turns this off')
+    parser.add_argument('--batch-size', type=int, default=200, help='Pages per streamed index batch and crawl checkpoint')
+    parser.add_argument('--log-level', default='WARNING', help='DEBUG shows the full page, document and index dumps')
+    parser.add_argument('--stats', action='store_true', help='Collect per-stage timings and counters and print them at exit')
+    parser.add_argument('--profile', nargs='?', const='', metavar='FILE', help='Run under cProfile; write stats to FILE or print them')
+    parser.add_argument('--trace-memory', action='store_true', help='Run under tracemalloc and print the top allocation sites')
     args = parser.parse_args()
-    
-    main(load_from_db=args.load_db)
+
+    Instrumentation.configure_logging(args.log_level)
+    if args.stats:
+        Instrumentation.STATS.enable(printAtExit=True)
+    with contextlib.ExitStack() as stack:
+        if args.profile is not None:
+            stack.enter_context(Instrumentation.STATS.profile(args.profile or None))
+        if args.trace_memory:
+            stack.enter_context(Instrumentation.STATS.trace_memory())
+        main(load_from_db=args.load_db, fuzzy=args.fuzzy, fresh_crawl=args.fresh_crawl,
+             parse_workers=args.parse_workers, stream=args.stream, batch_size=args.batch_size,
+             duplicate_distance=args.duplicate_distance)
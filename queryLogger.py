@@ -0,0 +1,135 @@
+import logging
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List
+
+import database as Database
+
+log = logging.getLogger(__name__)
+
+class QueryLogger:
+    """Write-behind logger for the search_results table.
+
+    log() only puts rows on a bounded queue; a background thread owns its own
+    database connection and writes them with executemany, flushing when
+    batchSize rows are buffered, every flushInterval seconds, and on close().
+    When the queue is full the rows are dropped (dropOnFull=True) or the
+    caller waits up to putTimeout seconds before dropping them. A batch that
+    fails to write (e.g. the database is locked) is counted in failed and
+    dropped; the thread keeps writing later batches.
+    """
+
+    def __init__(self, db_name="search_engine.db", batchSize=500, flushInterval=1.0,
+                 maxQueue=10000, dropOnFull=True, putTimeout=0.1, closeTimeout=10.0):
+        self.db_name = db_name
+        self.batchSize = batchSize
+        self.flushInterval = flushInterval
+        self.dropOnFull = dropOnFull
+        self.putTimeout = putTimeout
+        self.closeTimeout = closeTimeout
+        self.queue = queue.Queue(maxsize=maxQueue)
+        self.logged = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.closed = False
+        self.stopping = threading.Event()
+        self.ready = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name="QueryLogger", daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        if self.error is not None:
+            raise self.error
+
+    def log(self, query: str, results: List[tuple]) -> bool:
+        """Queue (doc_id, score) results for query. Returns False if they were dropped."""
+        if self.closed:
+            return False
+        # Same format as SQLite's CURRENT_TIMESTAMP, taken when the search ran
+        timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        # Tells apart searches for the same query within the same second
+        searchId = uuid.uuid4().hex
+        rows = [(query, doc_id, score, timestamp, searchId) for doc_id, score in results]
+        if not rows:
+            return True
+        try:
+            if self.dropOnFull:
+                self.queue.put_nowait(rows)
+            else:
+                self.queue.put(rows, timeout=self.putTimeout)
+        except queue.Full:
+            self.dropped += len(rows)
+            return False
+        self.logged += len(rows)
+        return True
+
+    def run(self):
+        try:
+            db = Database.Database(self.db_name)
+        except Exception as e:
+            self.error = e
+            self.ready.set()
+            return
+        self.ready.set()
+        buffer = []
+        lastFlush = time.monotonic()
+        while True:
+            timeout = max(0.0, self.flushInterval - (time.monotonic() - lastFlush))
+            try:
+                rows = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                # close() could not queue its None while the queue was full
+                if self.stopping.is_set():
+                    break
+                rows = []
+            if rows is None:
+                break
+            buffer.extend(rows)
+            if len(buffer) >= self.batchSize or time.monotonic() - lastFlush >= self.flushInterval:
+                self.write(db, buffer)
+                buffer = []
+                lastFlush = time.monotonic()
+        # Drain whatever was queued before close()
+        while True:
+            try:
+                rows = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if rows:
+                buffer.extend(rows)
+        self.write(db, buffer)
+        db.close()
+
+    def write(self, db, rows):
+        try:
+            self.written += db.save_search_results_batch(rows)
+        except Exception:
+            log.exception("Dropping %d logged results that could not be written", len(rows))
+            self.failed += len(rows)
+            # Don't let a half-written batch be committed with the next one
+            db.conn.rollback()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.stopping.set()
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass  # the writer sees stopping once it has drained the queue
+        if self.thread.is_alive():
+            self.thread.join(self.closeTimeout)
+            if self.thread.is_alive():
+                log.warning("Query logger still writing after %.1fs; %d rows may be lost",
+                            self.closeTimeout, self.queue.qsize())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
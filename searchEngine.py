@@ -1,14 +1,43 @@
 import math
 import re
+import time
 from collections import Counter
 
+import getPage as GetPage
 import indexer as Indexer
+import instrumentation as Instrumentation
+
+STATS = Instrumentation.STATS
 
 class SearchEngine:
-    def __init__(self, indexer: Indexer): 
+    def __init__(self, indexer: Indexer, maxExpansions=3, fuzzyBudget=0.005, storedFields=None): 
         self.indexer = indexer
+        # Document text, only read by similarQuery; scoring uses the index alone
+        self.storedFields = storedFields
+        self.maxExpansions = maxExpansions
+        self.fuzzyBudget = fuzzyBudget
+
+    def expandTerms(self, words):
+        """Replace query words missing from the index with close vocabulary words, if a fuzzy index exists."""
+        fuzzy = getattr(self.indexer, 'fuzzy', None)
+        if fuzzy is None:
+            return words
+        expanded = []
+        deadline = time.perf_counter() + self.fuzzyBudget
+        for word in words:
+            # freqWordDoc holds the whole vocabulary even when invInd is partial (a shard, or loadTerms)
+            if word in self.indexer.freqWordDoc:
+                expanded.append(word)
+                continue
+            budget = deadline - time.perf_counter()
+            if budget <= 0:
+                continue
+            for match, _, _ in fuzzy.lookup(word, self.indexer.freqWordDoc, self.maxExpansions, budget):
+                expanded.append(match)
+        return expanded
     
-    def search(self, query, maxResults=50):
+    def parseQuery(self, query):
+        """Stem the query and split it into (query words, quoted phrases)."""
         porter = Indexer.Porter()
         query = " ".join([porter.strip_affixes(word) for word in query.split()])
         phMatched = re.findall(r'"([^"]+)"', query)
@@ -18,41 +47,53 @@ class SearchEngine:
             allWd.extend(self.indexer.preText(phrase))
         if remaining_query:
             allWd.extend(self.indexer.preText(remaining_query))
-        if not allWd:
-            return []
+        allWd = self.expandTerms(allWd)
+        return allWd, phMatched
+
+    def candidateDocs(self, allWd):
         candidate_docs = set()
         for word in allWd:
             if word in self.indexer.invInd:
                 candidate_docs.update(self.indexer.invInd[word].keys())
+        return candidate_docs
+
+    @STATS.timed('search')
+    def search(self, query, maxResults=50):
+        allWd, phMatched = self.parseQuery(query)
+        if not allWd:
+            return []
+        candidate_docs = self.candidateDocs(allWd)
+        STATS.count('queries')
+        STATS.observe('candidates_scored', len(candidate_docs))
         scores = []
-        for docId in candidate_docs:
-            score, wordFreq = self.calculate_doc_score(docId, allWd, phMatched)
-            scores.append((docId, score, wordFreq))
+        with STATS.timer('score'):
+            for docId in candidate_docs:
+                score, wordFreq = self.calculate_doc_score(docId, allWd, phMatched)
+                scores.append((docId, score, wordFreq))
         scores.sort(key=lambda x: x[1], reverse=True)
         return scores[:maxResults]
     
     def calculate_doc_score(self, docId, Qwd, phMatched):
-        doc_info = self.indexer.docs[docId]
-        allDocWd = doc_info['titleWd'] + doc_info['contentWd']
+        """
+        Score docId from its postings, length and max term frequency.
+        Returns (score, wordFreq), wordFreq holding the total/title/content
+        counts of the query words found in the document.
+        """
         wordFreq = {}
-        for word in set(allDocWd):
-            wordFreq[word] = {
-                'total': allDocWd.count(word),
-                'title': doc_info['titleWd'].count(word),
-                'content': doc_info['contentWd'].count(word)
-            }
         wQ = {}
+        wDoc = {}
+        tfMax = self.indexer.maxTf[docId]
         for word in set(Qwd):
             tf_query = Qwd.count(word)
             idf = math.log(self.indexer.docNo / (self.indexer.freqWordDoc.get(word, 1) or 1))
             wQ[word] = tf_query * idf
-        wDoc = {}
-        for word in set(allDocWd):
-            tf_doc = allDocWd.count(word)
-            tfMax = max([allDocWd.count(t) for t in set(allDocWd)] or [1])
-            idf = math.log(self.indexer.docNo / (self.indexer.freqWordDoc.get(word, 1) or 1))
+            positions = self.indexer.invInd.get(word, {}).get(docId)
+            if positions is None:
+                continue
+            titleNo = len(positions['titlePos'])
+            tf_doc = titleNo + len(positions['contentPos'])
+            wordFreq[word] = {'total': tf_doc, 'title': titleNo, 'content': tf_doc - titleNo}
             wB = (tf_doc / tfMax) * idf  
-            titleNo = doc_info['titleWd'].count(word)
             if titleNo > 0:
                 wB *= 2  
             wDoc[word] = wB
@@ -107,30 +148,39 @@ class SearchEngine:
                     break
         return bool(contentPos)
         
-    def similarSearch(self, docId, originalQ=None, maxAns=50):
+    def similarQuery(self, docId, originalQ=None):
+        """Build the query used to find pages similar to docId, or None if the page has no usable words."""
         stop_words = Indexer.File.get_stop_words_set()
-        doc_info = self.indexer.docs[docId]
-        allwd = doc_info['titleWd'] + doc_info['contentWd']
+        fields = self.storedFields.get(docId) if self.storedFields is not None else None
+        if fields is None:
+            raise KeyError(docId)
+        url, title, body = fields
+        file = Indexer.File(GetPage.Page(docId, None, url, title or '', None, body or ''))
+        allwd = self.indexer.preText(file.title) + self.indexer.preText(file.body)
         wdCounts = Counter()
         for wd in allwd:
             if (wd not in stop_words and len(wd) > 2 and wd.isalpha() and wd.lower() == wd): 
                 wdCounts[wd] += 1
         topSearch = [wd for wd, count in wdCounts.most_common(5)]
         if not topSearch:
-            return []
+            return None
         if originalQ:
             originalSearch = []  
             for t in self.indexer.preText(originalQ):  
                 if t not in stop_words and len(t) > 2:  
                     originalSearch.append(t)  
             combinedSearch = list(set(originalSearch + topSearch))
-            newQ = ' '.join(combinedSearch)
-        else:
-            newQ = ' '.join(topSearch)
+            return ' '.join(combinedSearch)
+        return ' '.join(topSearch)
+
+    def similarSearch(self, docId, originalQ=None, maxAns=50):
+        newQ = self.similarQuery(docId, originalQ)
+        if newQ is None:
+            return []
         similarSearch = self.search(newQ, maxAns)
         newSearch = []
         for doc in similarSearch:
-            if doc != docId:
+            if doc[0] != docId:
                 newSearch.append(doc)
         similarSearch = newSearch
         
@@ -138,14 +188,21 @@ class SearchEngine:
 
 # Example only
 if __name__ == "__main__":    
+    import storedFields as StoredFields
+    docs = [
+        (1, "Hong Kong Universities", "Hong Kong has several prestigious universities including HKUST."),
+        (2, "Chinese Universities", "China has many top universities such as Tsinghua and Peking University."),
+        (3, "Education in Hong Kong", "The education system in Hong Kong is competitive with many international schools."),
+        (4, "Top Asian Universities", "Asian universities like HKU, HKUST, Tsinghua, and NUS are among the best in the world."),
+        (5, "University Rankings", "Global university rankings often feature institutions from Hong Kong and China prominently."),
+    ]
     indexer = Indexer.Indexer()
-    indexer.indexDoc(1, "Hong Kong Universities", "Hong Kong has several prestigious universities including HKUST.")
-    indexer.indexDoc(2, "Chinese Universities", "China has many top universities such as Tsinghua and Peking University.")
-    indexer.indexDoc(3, "Education in Hong Kong", "The education system in Hong Kong is competitive with many international schools.")
-    indexer.indexDoc(4, "Top Asian Universities", "Asian universities like HKU, HKUST, Tsinghua, and NUS are among the best in the world.")
-    indexer.indexDoc(5, "University Rankings", "Global university rankings often feature institutions from Hong Kong and China prominently.")
+    storedFields = StoredFields.StoredFields()
+    for docId, title, body in docs:
+        indexer.indexDoc(docId, title, body)
+        storedFields.add(docId, None, title, body)
 
-    engine = SearchEngine(indexer)
+    engine = SearchEngine(indexer, storedFields=storedFields)
     
     # Perform searches
     print("Search for 'hong kong':", engine.search("hong kong"))
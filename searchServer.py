@@ -0,0 +1,248 @@
+import argparse
+import contextlib
+import json
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import autocomplete as Autocomplete
+import database as Database
+import indexer as Indexer
+import instrumentation as Instrumentation
+import queryLogger as QueryLogger
+import searchEngine as SearchEngine
+import storedFields as StoredFields
+
+class Snapshot:
+    """Everything a request needs. The index is never modified once built; only the completer learns new queries."""
+
+    def __init__(self, indexer, storedFields=None, version=0):
+        self.storedFields = storedFields or StoredFields.StoredFields()
+        self.engine = SearchEngine.SearchEngine(indexer, storedFields=self.storedFields)
+        self.version = version
+        self.completer = Autocomplete.Autocomplete().addVocabulary(indexer.freqWordDoc, indexer.surfaceForms())
+        self.users = 0  # requests and search jobs still using it; counted by SearchService
+
+    def close(self):
+        self.storedFields.close()
+
+class SearchService:
+    """
+    Serves searches from one shared in-memory index.
+    At most maxConcurrent searches run at once, each bounded by timeout seconds.
+    reload() builds a new snapshot from the database while requests keep being served, then swaps
+    it in with a single assignment; requests already running finish on the old one, whose
+    database connection is closed when the last of them ends.
+    """
+
+    def __init__(self, db_name="search_engine.db", maxConcurrent=8, timeout=2.0, fuzzy=False, logger=None):
+        self.db_name = db_name
+        self.timeout = timeout
+        self.fuzzy = fuzzy
+        self.logger = logger
+        self.slots = threading.BoundedSemaphore(maxConcurrent)
+        self.executor = ThreadPoolExecutor(max_workers=maxConcurrent, thread_name_prefix="search")
+        self.reloadLock = threading.Lock()
+        self.snapshotLock = threading.Lock()
+        self.snapshot = None
+
+    def load(self):
+        db = Database.Database(self.db_name)
+        try:
+            indexer = Indexer.load_from_database(db, fuzzy=self.fuzzy)
+            queryCounts = db.load_query_counts()
+        finally:
+            db.close()
+        # Titles and snippets are read on demand, from request threads
+        storedFields = StoredFields.StoredFields(Database.Database(self.db_name, check_same_thread=False))
+        version = self.snapshot.version + 1 if self.snapshot else 1
+        try:
+            snapshot = Snapshot(indexer, storedFields, version)
+        except Exception:
+            storedFields.close()
+            raise
+        snapshot.completer.addQueries(queryCounts)
+        return snapshot
+
+    def swap(self, snapshot):
+        with self.snapshotLock:
+            old, self.snapshot = self.snapshot, snapshot
+            closeOld = old is not None and old.users == 0
+        if closeOld:
+            old.close()
+        return snapshot.version
+
+    @contextlib.contextmanager
+    def using(self):
+        """The current snapshot, kept open until the block ends even if a reload replaces it meanwhile."""
+        with self.snapshotLock:
+            snapshot = self.snapshot
+            snapshot.users += 1
+        try:
+            yield snapshot
+        finally:
+            self.release(snapshot)
+
+    def release(self, snapshot):
+        with self.snapshotLock:
+            snapshot.users -= 1
+            closeNow = snapshot.users == 0 and snapshot is not self.snapshot
+        if closeNow:
+            snapshot.close()
+
+    def reload(self):
+        """Rebuild the snapshot from the database. Returns the new version, or None if a reload is already running."""
+        if not self.reloadLock.acquire(blocking=False):
+            return None
+        try:
+            return self.swap(self.load())
+        finally:
+            self.reloadLock.release()
+
+    def run(self, snapshot, fn, *args):
+        """
+        Run fn, which uses snapshot, on the worker pool. The caller must be using snapshot.
+        Raises OverflowError when saturated, TimeoutError when too slow.
+        """
+        if not self.slots.acquire(blocking=False):
+            raise OverflowError("too many concurrent requests")
+        with self.snapshotLock:
+            snapshot.users += 1
+        try:
+            future = self.executor.submit(fn, *args)
+        except Exception:
+            self.slots.release()
+            self.release(snapshot)
+            raise
+
+        def done(_):
+            self.slots.release()
+            self.release(snapshot)
+        # The slot and snapshot are held until the work really ends, even if the caller gives up
+        future.add_done_callback(done)
+        return future.result(timeout=self.timeout)
+
+    def describe(self, snapshot, results, query=''):
+        """Attach url, title and a snippet around the query words, read only for the returned documents."""
+        words = re.findall(r'\w+', query or '')
+        described = []
+        for docId, score, _ in results:
+            url, title, _ = snapshot.storedFields.get(docId) or (None, None, None)
+            described.append({'doc_id': docId, 'score': score, 'url': url, 'title': title,
+                              'snippet': snapshot.storedFields.snippet(docId, words)})
+        return described
+
+    def search(self, query, maxResults=50):
+        with self.using() as snapshot:
+            results = self.run(snapshot, snapshot.engine.search, query, maxResults)
+            if self.logger is not None:
+                self.logger.log(query, [(docId, score) for docId, score, _ in results])
+            snapshot.completer.addQuery(query)
+            return {'version': snapshot.version, 'query': query, 'results': self.describe(snapshot, results, query)}
+
+    def similar(self, docId, query=None, maxResults=50):
+        with self.using() as snapshot:
+            if docId not in snapshot.engine.indexer.lenDoc:
+                raise KeyError(docId)
+            results = self.run(snapshot, snapshot.engine.similarSearch, docId, query, maxResults)
+            return {'version': snapshot.version, 'doc_id': docId, 'results': self.describe(snapshot, results, query)}
+
+    def complete(self, prefix, limit=10):
+        snapshot = self.snapshot
+        return {'version': snapshot.version, 'prefix': prefix, 'completions': snapshot.completer.complete(prefix, limit)}
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        with self.snapshotLock:
+            snapshot, self.snapshot = self.snapshot, None
+        if snapshot is not None and snapshot.users == 0:
+            snapshot.close()
+        if self.logger is not None:
+            self.logger.close()
+
+class SearchHandler(BaseHTTPRequestHandler):
+    service: SearchService = None
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        try:
+            if url.path == '/search':
+                body = self.service.search(params.get('q', ''), int(params.get('n', 50)))
+            elif url.path == '/similar':
+                body = self.service.similar(int(params['doc']), params.get('q'), int(params.get('n', 50)))
+            elif url.path == '/complete':
+                body = self.service.complete(params.get('prefix', ''), int(params.get('n', 10)))
+            elif url.path == '/stats':
+                body = Instrumentation.STATS.snapshot()
+            elif url.path == '/health':
+                body = {'status': 'ok', 'version': self.service.snapshot.version}
+            else:
+                return self.send_json(404, {'error': 'not found'})
+        except (KeyError, ValueError) as e:
+            return self.send_json(400, {'error': f'bad request: {e}'})
+        except OverflowError as e:
+            return self.send_json(503, {'error': str(e)})
+        except TimeoutError:
+            return self.send_json(504, {'error': 'search timed out'})
+        except Exception as e:
+            return self.send_json(500, {'error': f'{type(e).__name__}: {e}'})
+        self.send_json(200, body)
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/reload':
+            return self.send_json(404, {'error': 'not found'})
+        try:
+            version = self.service.reload()
+        except Exception as e:
+            # The old snapshot keeps serving
+            return self.send_json(500, {'error': f'reload failed: {type(e).__name__}: {e}'})
+        if version is None:
+            return self.send_json(409, {'error': 'reload already in progress'})
+        self.send_json(200, {'status': 'reloaded', 'version': version})
+
+    def log_message(self, format, *args):
+        pass
+
+def make_server(service, host="127.0.0.1", port=8000):
+    handler = type('BoundSearchHandler', (SearchHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Local search server')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--db', default='search_engine.db')
+    parser.add_argument('--max-concurrent', type=int, default=8, help='Searches allowed to run at once')
+    parser.add_argument('--timeout', type=float, default=2.0, help='Per-request search timeout in seconds')
+    parser.add_argument('--fuzzy', action='store_true', help='Expand misspelled query terms using a fuzzy term index')
+    parser.add_argument('--log-queries', action='store_true', help='Log queries to search_results in the background')
+    parser.add_argument('--stats', action='store_true', help='Collect per-stage timings, served at GET /stats')
+    args = parser.parse_args()
+
+    if args.stats:
+        Instrumentation.STATS.enable()
+
+    logger = QueryLogger.QueryLogger(args.db) if args.log_queries else None
+    service = SearchService(args.db, args.max_concurrent, args.timeout, args.fuzzy, logger)
+    service.swap(service.load())
+    server = make_server(service, port=args.port)
+    print(f"Serving on http://127.0.0.1:{args.port} (index version {service.snapshot.version})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
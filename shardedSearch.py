@@ -0,0 +1,236 @@
+import heapq
+import itertools
+import multiprocessing as mp
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, TimeoutError
+from typing import List
+
+import database as Database
+import indexer as Indexer
+import searchEngine as SearchEngine
+import storedFields as StoredFields
+
+def shard_of(docId, numShards):
+    return docId % numShards
+
+def partition(indexer: Indexer.Indexer, numShards) -> List[Indexer.Indexer]:
+    """
+    Split an in-memory index into numShards indexes by doc_id.
+    Every shard keeps the global docNo and freqWordDoc, and document lengths
+    are copied rather than recomputed, so each shard scores its documents
+    exactly as the full index would.
+    """
+    shards = []
+    for _ in range(numShards):
+        shard = Indexer.Indexer()
+        shard.docNo = indexer.docNo
+        shard.freqWordDoc = indexer.freqWordDoc
+        shards.append(shard)
+    for docId, length in indexer.lenDoc.items():
+        shard = shards[shard_of(docId, numShards)]
+        shard.lenDoc[docId] = length
+        shard.maxTf[docId] = indexer.maxTf[docId]
+    for word, postings in indexer.invInd.items():
+        for docId, positions in postings.items():
+            shards[shard_of(docId, numShards)].invInd[word][docId] = positions
+    return shards
+
+def serve_shard(shard, numShards, source, requests, results, storedFields=None):
+    """Worker process: load one shard, then answer (requestId, method, args) messages until None."""
+    try:
+        if isinstance(source, str):
+            db = Database.Database(source)
+            indexer = Indexer.load_from_database(db, shard=shard, num_shards=numShards)
+            db.close()
+            if storedFields is None:
+                storedFields = StoredFields.StoredFields(Database.Database(source))
+        else:
+            indexer = source
+    except Exception as e:
+        results.put((None, shard, False, repr(e)))
+        return
+    engine = SearchEngine.SearchEngine(indexer, storedFields=storedFields)
+    results.put((None, shard, True, len(indexer.lenDoc)))
+    while True:
+        message = requests.get()
+        if message is None:
+            break
+        requestId, method, args = message
+        try:
+            if method == 'search':
+                payload = engine.search(*args)
+            elif method == 'similarQuery':
+                payload = engine.similarQuery(*args)
+            else:
+                raise ValueError(f"unknown method {method}")
+            results.put((requestId, shard, True, payload))
+        except Exception as e:
+            results.put((requestId, shard, False, repr(e)))
+
+class ShardedSearchEngine:
+    """
+    Scatter-gather search over numShards worker processes.
+    Documents are partitioned by doc_id % numShards. A query is broadcast to
+    every shard, each returns its own top maxResults, and the coordinator
+    merges them with a heap. Many threads may call search() at once; replies
+    are matched to callers by request id.
+    Shards must load within loadTimeout seconds and answer within timeout
+    seconds. If a shard process dies, the calls waiting on it fail and later
+    calls raise RuntimeError instead of waiting for it.
+    """
+
+    def __init__(self, numShards, db_name="search_engine.db", indexer=None, storedFields=None,
+                 timeout=30.0, loadTimeout=300.0):
+        self.numShards = numShards
+        self.timeout = timeout
+        self.dead = set()
+        self.closing = False
+        self.ctx = mp.get_context()
+        self.results = self.ctx.Queue()
+        self.requests = []
+        self.workers = []
+        self.pending = {}
+        self.pendingLock = threading.Lock()
+        self.ids = itertools.count()
+        shards = partition(indexer, numShards) if indexer is not None else [db_name] * numShards
+        for shard in range(numShards):
+            requests = self.ctx.Queue()
+            worker = self.ctx.Process(target=serve_shard, daemon=True,
+                                      args=(shard, numShards, shards[shard], requests, self.results, storedFields))
+            worker.start()
+            self.requests.append(requests)
+            self.workers.append(worker)
+        self.shardSizes = {}
+        errors = []
+        deadline = time.monotonic() + loadTimeout
+        while len(self.shardSizes) + len(errors) < numShards:
+            try:
+                _, shard, ok, payload = self.results.get(timeout=1.0)
+            except queue.Empty:
+                dead = [shard for shard in self.deadShards() if shard not in self.shardSizes]
+                if dead:
+                    errors.append(f"shard {dead[0]} process exited")
+                    break
+                if time.monotonic() > deadline:
+                    errors.append(f"shards did not load within {loadTimeout}s")
+                    break
+                continue
+            if ok:
+                self.shardSizes[shard] = payload
+            else:
+                errors.append(payload)
+        if errors:
+            for requests, worker in zip(self.requests, self.workers):
+                requests.put(None)
+                worker.join(1.0)
+                if worker.is_alive():
+                    worker.terminate()
+            raise RuntimeError(f"shard failed to load: {errors[0]}")
+        self.collector = threading.Thread(target=self.collect, name="ShardCollector", daemon=True)
+        self.collector.start()
+
+    def deadShards(self):
+        return [shard for shard, worker in enumerate(self.workers) if not worker.is_alive()]
+
+    def failDeadShards(self, replies):
+        """Fail every pending call waiting on a shard whose process has exited."""
+        dead = set(self.deadShards()) - self.dead
+        if not dead or self.closing:
+            return
+        self.dead |= dead
+        with self.pendingLock:
+            failed = [(requestId, future) for requestId, (future, shards) in self.pending.items() if dead & shards]
+            for requestId, _ in failed:
+                del self.pending[requestId]
+        for requestId, future in failed:
+            replies.pop(requestId, None)
+            future.set_exception(RuntimeError(f"shard process {min(dead)} exited"))
+
+    def collect(self):
+        replies = defaultdict(dict)
+        while True:
+            try:
+                message = self.results.get(timeout=1.0)
+            except queue.Empty:
+                self.failDeadShards(replies)
+                continue
+            if message is None:
+                break
+            requestId, shard, ok, payload = message
+            with self.pendingLock:
+                if requestId not in self.pending:
+                    # The caller timed out or the call failed on another shard
+                    replies.pop(requestId, None)
+                    continue
+                future, shards = self.pending[requestId]
+                replies[requestId][shard] = (ok, payload)
+                if len(replies[requestId]) < len(shards):
+                    continue
+                del self.pending[requestId]
+            got = replies.pop(requestId)
+            failed = [payload for ok, payload in got.values() if not ok]
+            if failed:
+                future.set_exception(RuntimeError(f"shard failed: {failed[0]}"))
+            else:
+                future.set_result({shard: payload for shard, (_, payload) in got.items()})
+
+    def call(self, method, args, shards=None):
+        shards = set(range(self.numShards) if shards is None else shards)
+        if self.dead & shards:
+            raise RuntimeError(f"shard process {min(self.dead & shards)} exited")
+        requestId = next(self.ids)
+        future = Future()
+        with self.pendingLock:
+            self.pending[requestId] = (future, shards)
+        for shard in shards:
+            self.requests[shard].put((requestId, method, args))
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            with self.pendingLock:
+                self.pending.pop(requestId, None)
+            raise
+
+    def search(self, query, maxResults=50):
+        perShard = self.call('search', (query, maxResults))
+        return heapq.nlargest(maxResults, itertools.chain.from_iterable(perShard.values()), key=lambda x: x[1])
+
+    def similarSearch(self, docId, originalQ=None, maxAns=50):
+        shard = shard_of(docId, self.numShards)
+        newQ = self.call('similarQuery', (docId, originalQ), [shard])[shard]
+        if newQ is None:
+            return []
+        return [doc for doc in self.search(newQ, maxAns) if doc[0] != docId][:maxAns]
+
+    def close(self):
+        self.closing = True
+        for requests in self.requests:
+            requests.put(None)
+        for worker in self.workers:
+            worker.join(self.timeout)
+            if worker.is_alive():
+                worker.terminate()
+        self.results.put(None)
+        self.collector.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Sharded search over an existing database')
+    parser.add_argument('--shards', type=int, default=mp.cpu_count())
+    parser.add_argument('--db', default='search_engine.db')
+    parser.add_argument('queries', nargs='*', default=["hong kong", '"science"', "universities", "hong kong universities"])
+    args = parser.parse_args()
+
+    with ShardedSearchEngine(args.shards, args.db) as engine:
+        print(f"Shard sizes: {engine.shardSizes}")
+        for query in args.queries:
+            print(f"Search for '{query}':", [(docId, score) for docId, score, _ in engine.search(query)])
@@ -0,0 +1,123 @@
+import hashlib
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+def shingles(words: List[str], size):
+    if len(words) < size:
+        return [' '.join(words)] if words else []
+    return [' '.join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+# BIT_TABLES[bit] maps a byte to 1 if bit is set in it, else 0 (for bytes.translate)
+BIT_TABLES = [bytes(value >> bit & 1 for value in range(256)) for bit in range(8)]
+
+def simhash(text, bits=64, shingleSize=3, minWords=8) -> Optional[int]:
+    """
+    SimHash fingerprint of text over word shingles, or None if the text has
+    fewer than minWords words (too short to compare meaningfully).
+    Near-identical texts get fingerprints a small Hamming distance apart.
+    """
+    words = re.findall(r'\w+', text.lower())
+    if len(words) < minWords:
+        return None
+    # Each distinct shingle is hashed once, and its hash repeated as often as
+    # the shingle occurs. Instead of walking every bit of every hash in Python,
+    # the byte at each position of all the hashes is sliced out and its set
+    # bits counted in C.
+    size = bits // 8
+    counts = Counter(shingles(words, shingleSize))
+    blake2b = hashlib.blake2b
+    data = b''.join(blake2b(shingle.encode('utf-8'), digest_size=size).digest() * count
+                    for shingle, count in counts.items())
+    total = len(data) // size
+    fingerprint = 0
+    for position in range(size):
+        column = data[position::size]
+        for bit in range(8):
+            ones = column.translate(BIT_TABLES[bit]).count(1)
+            # The bit's weight is ones - (total - ones)
+            if 2 * ones > total:
+                fingerprint |= 1 << (position * 8 + bit)
+    return fingerprint
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+class SimHashIndex:
+    """
+    Finds stored fingerprints within maxDistance bits of a new one without a
+    linear scan. The fingerprint is cut into maxDistance + 1 bands; two
+    fingerprints that differ in at most maxDistance bits must agree exactly on
+    at least one band, so only documents sharing a band bucket are compared.
+    Only canonical (first seen) documents are stored; duplicates are grouped
+    under the canonical document they matched.
+    """
+
+    def __init__(self, bits=64, maxDistance=6):
+        if not 0 <= maxDistance < bits:
+            raise ValueError(f"maxDistance must be between 0 and {bits - 1}")
+        self.bits = bits
+        self.maxDistance = maxDistance
+        numBands = maxDistance + 1
+        self.bands = []
+        start = 0
+        for i in range(numBands):
+            width = bits // numBands + (1 if i < bits % numBands else 0)
+            self.bands.append((start, (1 << width) - 1))
+            start += width
+        self.buckets = defaultdict(list)
+        self.clusters: Dict[int, List[int]] = {}  # canonical doc -> duplicate docs
+
+    def keys(self, fingerprint):
+        return [(i, fingerprint >> shift & mask) for i, (shift, mask) in enumerate(self.bands)]
+
+    def find(self, fingerprint) -> Optional[int]:
+        """The canonical document nearest to fingerprint within maxDistance, or None."""
+        best, bestDistance = None, self.maxDistance + 1
+        for key in self.keys(fingerprint):
+            for docId, stored in self.buckets.get(key, ()):
+                distance = hamming(fingerprint, stored)
+                if distance < bestDistance:
+                    best, bestDistance = docId, distance
+        return best
+
+    def addCanonical(self, docId, fingerprint):
+        for key in self.keys(fingerprint):
+            self.buckets[key].append((docId, fingerprint))
+        self.clusters.setdefault(docId, [])
+
+    def addDuplicate(self, docId, canonicalId):
+        self.clusters.setdefault(canonicalId, []).append(docId)
+
+    def add(self, docId, fingerprint) -> Optional[int]:
+        """Add a document. Returns the canonical document it duplicates, or None if it is new."""
+        if fingerprint is None:
+            return None
+        canonical = self.find(fingerprint)
+        if canonical is None:
+            self.addCanonical(docId, fingerprint)
+        else:
+            self.addDuplicate(docId, canonical)
+        return canonical
+
+    def stats(self):
+        sizes = [len(members) + 1 for members in self.clusters.values() if members]
+        return {
+            'canonical': len(self.clusters),
+            'duplicates': sum(sizes) - len(sizes),
+            'clusters': len(sizes),
+            'largest_cluster': max(sizes, default=0),
+        }
+
+def to_signed(fingerprint, bits=64):
+    """A bits-wide fingerprint as a signed integer; SQLite INTEGER stores at most 64 bits."""
+    if bits > 64:
+        raise ValueError(f"{bits}-bit fingerprints do not fit in an SQLite INTEGER")
+    if fingerprint is None:
+        return None
+    return fingerprint - (1 << bits) if fingerprint >= 1 << (bits - 1) else fingerprint
+
+def from_signed(value, bits=64):
+    if value is None:
+        return None
+    return value + (1 << bits) if value < 0 else value
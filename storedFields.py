@@ -0,0 +1,103 @@
+import json
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+# Documents per compressed block; a document's block is doc_id // BLOCK_SIZE
+BLOCK_SIZE = 16
+
+def block_of(docId):
+    return docId // BLOCK_SIZE
+
+def encode_block(fields: Dict[int, Tuple[str, str, str]]) -> bytes:
+    return zlib.compress(json.dumps({str(docId): list(f) for docId, f in fields.items()}).encode('utf-8'))
+
+def decode_block(data: bytes) -> Dict[int, Tuple[str, str, str]]:
+    return {int(docId): tuple(f) for docId, f in json.loads(zlib.decompress(data)).items()}
+
+class StoredFields:
+    """
+    The display fields (url, title, body) of every crawled page, kept apart
+    from the index. Consecutive doc ids are compressed together with zlib, so
+    text is stored once and compactly, and read only for the documents being
+    shown. The last cacheBlocks decompressed blocks are kept in an LRU cache,
+    since the results of one query tend to share blocks.
+    Backed by a Database's stored_fields table, or by an in-memory dict of
+    compressed blocks filled with add() when db is None.
+    """
+
+    def __init__(self, db=None, cacheBlocks=32):
+        self.db = db
+        self.blocks: Dict[int, bytes] = {}
+        self.cacheBlocks = cacheBlocks
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, docId, url, title, body):
+        blockId = block_of(docId)
+        with self.lock:
+            fields = decode_block(self.blocks[blockId]) if blockId in self.blocks else {}
+            fields[docId] = (url, title, body)
+            self.blocks[blockId] = encode_block(fields)
+            self.cache.pop(blockId, None)
+        return self
+
+    def addPages(self, pages: Iterable):
+        for page in pages:
+            self.add(page.page_id, page.url, page.title, page.body)
+        return self
+
+    def block(self, blockId) -> Dict[int, Tuple[str, str, str]]:
+        with self.lock:
+            fields = self.cache.get(blockId)
+            if fields is not None:
+                self.cache.move_to_end(blockId)
+                return fields
+            data = self.db.load_stored_block(blockId) if self.db is not None else self.blocks.get(blockId)
+            fields = decode_block(data) if data is not None else {}
+            self.cache[blockId] = fields
+            if len(self.cache) > self.cacheBlocks:
+                self.cache.popitem(last=False)
+            return fields
+
+    def get(self, docId) -> Optional[Tuple[str, str, str]]:
+        """(url, title, body) of docId, or None if it was never stored."""
+        return self.block(block_of(docId)).get(docId)
+
+    def title(self, docId) -> Optional[str]:
+        fields = self.get(docId)
+        return fields[1] if fields is not None else None
+
+    def snippet(self, docId, words=(), length=30) -> Optional[str]:
+        """
+        Up to length words of the body, starting just before the first
+        occurrence of any of words (compared case-insensitively), or at the
+        beginning if none occurs.
+        """
+        fields = self.get(docId)
+        if fields is None:
+            return None
+        body = (fields[2] or '').split()
+        targets = {w.lower() for w in words}
+        start = 0
+        for i, token in enumerate(body):
+            if re.sub(r'\W+', '', token.lower()) in targets:
+                start = max(0, i - length // 4)
+                break
+        return ' '.join(body[start:start + length])
+
+    def __getstate__(self):
+        # Only an in-memory store can be sent to another process
+        if self.db is not None:
+            raise TypeError("a database-backed StoredFields cannot be pickled")
+        return {'blocks': self.blocks, 'cacheBlocks': self.cacheBlocks}
+
+    def __setstate__(self, state):
+        self.__init__(cacheBlocks=state['cacheBlocks'])
+        self.blocks = state['blocks']
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()